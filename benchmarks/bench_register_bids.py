@@ -0,0 +1,87 @@
+import argparse
+import random
+import time
+
+from dnd_auction_game.auction_house import AuctionHouse
+
+
+############################################################################################
+#
+# register_bids (one call per message) vs register_bid (one call per bid)
+#
+#   python benchmarks/bench_register_bids.py --agents 1000 --bids 10
+#
+############################################################################################
+
+
+def _setup(n_agents:int, seed:int) -> AuctionHouse:
+    auction_house = AuctionHouse(game_token="", play_token="", save_logs=False, seed=seed)
+    for i in range(n_agents):
+        a_id = "bench_agent_{}".format(i)
+        auction_house.add_agent(a_id, a_id, a_id)
+
+    auction_house.set_num_rounds(10)
+    auction_house.assign_priorities()
+    auction_house.prepare_auctions_and_pool()
+    return auction_house
+
+
+def _messages(auction_house:AuctionHouse, n_bids:int, seed:int) -> dict:
+    rng = random.Random(seed)
+    auction_ids = list(auction_house.current_auctions.keys())
+    return {a_id: {auction_id: rng.randint(1, 100) for auction_id in rng.sample(auction_ids, min(n_bids, len(auction_ids)))}
+            for a_id in auction_house.agents}
+
+
+def bench_per_bid(n_agents:int, n_bids:int, seed:int=0) -> float:
+    auction_house = _setup(n_agents, seed)
+    messages = _messages(auction_house, n_bids, seed)
+
+    start = time.perf_counter()
+    for a_id, bids in messages.items():
+        for auction_id, gold in bids.items():
+            auction_house.register_bid(a_id, str(auction_id), gold)
+    return time.perf_counter() - start
+
+
+def bench_batch(n_agents:int, n_bids:int, seed:int=0) -> float:
+    auction_house = _setup(n_agents, seed)
+    messages = _messages(auction_house, n_bids, seed)
+
+    start = time.perf_counter()
+    for a_id, bids in messages.items():
+        auction_house.register_bids(a_id, bids)
+    return time.perf_counter() - start
+
+
+def bench_oversized(n_agents:int, n_bids:int, seed:int=0) -> float:
+    # a message with far more entries than auctions is rejected without looking at the bids
+    auction_house = _setup(n_agents, seed)
+    a_id = next(iter(auction_house.agents))
+    bids = {"a{}".format(i): 1 for i in range(n_bids)}
+
+    start = time.perf_counter()
+    auction_house.register_bids(a_id, bids)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched bid registration.")
+    parser.add_argument("--agents", type=int, default=1000, help="Number of agents (default: 1000)")
+    parser.add_argument("--bids", type=int, default=10, help="Bids per agent message (default: 10)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best time is reported (default: 5)")
+    args = parser.parse_args()
+
+    per_bid = min(bench_per_bid(args.agents, args.bids, seed) for seed in range(args.repeat))
+    batch = min(bench_batch(args.agents, args.bids, seed) for seed in range(args.repeat))
+    oversized = min(bench_oversized(args.agents, 100000, seed) for seed in range(args.repeat))
+
+    n = args.agents * args.bids
+    print("{} agents x {} bids".format(args.agents, args.bids))
+    print("register_bid   {:8.2f} ms  ({:.0f} ns/bid)".format(per_bid * 1000, per_bid / n * 1e9))
+    print("register_bids  {:8.2f} ms  ({:.0f} ns/bid)  x{:.1f}".format(batch * 1000, batch / n * 1e9, per_bid / batch))
+    print("100k bid message rejected in {:.3f} ms".format(oversized * 1000))
+
+
+if __name__ == "__main__":
+    main()
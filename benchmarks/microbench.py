@@ -0,0 +1,282 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.game import Game
+from dnd_auction_game.protocol import SCHEDULE_DELTA, COMPACT_STATES, encode_round_state
+
+
+############################################################################################
+#
+# Microbenchmarks of the auction house hot paths
+#   Every case is timed for each agent count after the game has been played for some
+#   rounds, and run once more under tracemalloc for its peak memory. Results can be saved
+#   as a baseline and later runs compared against it.
+#
+#   Small rounds are done in plain Python, big ones with NumPy (AuctionHouse.python_max_auctions
+#   and python_max_bids), the *_python and *_numpy cases force one path to show the crossover:
+#   python benchmarks/microbench.py --agents 4,10,20,40,100 --cases process_all_bids_python,process_all_bids_numpy
+#
+#   python benchmarks/microbench.py --agents 10,100,1000,10000 --save baseline.json
+#   python benchmarks/microbench.py --agents 10,100,1000,10000 --compare baseline.json --threshold 0.2
+#
+############################################################################################
+
+
+BIDS_PER_AGENT = 5
+
+
+def _setup(n_agents:int, n_rounds:int, seed:int) -> AuctionHouse:
+    auction_house = AuctionHouse(game_token="", play_token="", save_logs=False, seed=seed)
+    for i in range(n_agents):
+        a_id = "bench_agent_{}".format(i)
+        auction_house.add_agent(a_id, a_id, a_id)
+
+    # room for the rounds played here and the ones the cases play
+    auction_house.set_num_rounds(n_rounds + 1000)
+    auction_house.assign_priorities()
+    auction_house.prepare_auctions_and_pool()
+
+    rng = random.Random(seed)
+    for _ in range(n_rounds):
+        _register_round(auction_house, rng)
+        auction_house.process_pool_buys()
+        auction_house.process_all_bids()
+        auction_house.prepare_auctions_and_pool()
+    return auction_house
+
+
+def _messages(auction_house:AuctionHouse, rng:random.Random) -> Dict[str, Dict[str, int]]:
+    auction_ids = list(auction_house.current_auctions.keys())
+    n_bids = min(BIDS_PER_AGENT, len(auction_ids))
+    return {a_id: {auction_id: rng.randint(1, 100) for auction_id in rng.sample(auction_ids, n_bids)}
+            for a_id in auction_house.agents}
+
+
+def _register_round(auction_house:AuctionHouse, rng:random.Random):
+    for a_id, bids in _messages(auction_house, rng).items():
+        auction_house.register_bids(a_id, bids)
+        if rng.random() < 0.2:
+            auction_house.register_pool_buy(a_id, rng.randint(1, 10))
+
+
+# every case does its (untimed) setup and returns the call to time
+
+def case_generate_auctions(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    return auction_house._generate_auctions
+
+
+def case_register_bid(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    auction_house.prepare_auctions_and_pool()
+    messages = _messages(auction_house, rng)
+
+    def run():
+        for a_id, bids in messages.items():
+            for auction_id, gold in bids.items():
+                auction_house.register_bid(a_id, auction_id, gold)
+    return run
+
+
+def case_register_bids(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    auction_house.prepare_auctions_and_pool()
+    messages = _messages(auction_house, rng)
+
+    def run():
+        for a_id, bids in messages.items():
+            auction_house.register_bids(a_id, bids)
+    return run
+
+
+def case_process_all_bids(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    auction_house.prepare_auctions_and_pool()
+    _register_round(auction_house, rng)
+    return auction_house.process_all_bids
+
+
+def _forced(case:Callable, python:bool) -> Callable:
+    def forced_case(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+        limit = 2**62 if python else -1
+        auction_house.python_max_auctions = limit
+        auction_house.python_max_bids = limit
+        return case(auction_house, game, rng)
+    return forced_case
+
+
+def case_process_pool_buys(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    auction_house.prepare_auctions_and_pool()
+    _register_round(auction_house, rng)
+    return auction_house.process_pool_buys
+
+
+def case_prepare_auctions_and_pool(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    _register_round(auction_house, rng)
+    auction_house.process_pool_buys()
+    auction_house.process_all_bids()
+    return auction_house.prepare_auctions_and_pool
+
+
+def case_leadboard(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    return game.compute_leadboard_state
+
+
+def case_encode(auction_house:AuctionHouse, game:Game, rng:random.Random) -> Callable:
+    # the round state as sent to agents with all wire features
+    _register_round(auction_house, rng)
+    auction_house.process_all_bids()
+    state = auction_house.prepare_auctions_and_pool()
+    return lambda: json.dumps(encode_round_state(state, (SCHEDULE_DELTA, COMPACT_STATES)))
+
+
+CASES = {
+    "generate_auctions": case_generate_auctions,
+    "register_bid": case_register_bid,
+    "register_bids": case_register_bids,
+    "process_all_bids": case_process_all_bids,
+    "process_all_bids_python": _forced(case_process_all_bids, python=True),
+    "process_all_bids_numpy": _forced(case_process_all_bids, python=False),
+    "generate_auctions_python": _forced(case_generate_auctions, python=True),
+    "generate_auctions_numpy": _forced(case_generate_auctions, python=False),
+    "process_pool_buys": case_process_pool_buys,
+    "prepare_auctions_and_pool": case_prepare_auctions_and_pool,
+    "leadboard": case_leadboard,
+    "encode": case_encode,
+}
+
+
+def _time_call(fn:Callable) -> float:
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def _peak_memory(fn:Callable) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_case(name:str, n_agents:int, n_rounds:int, repeat:int=5, seed:int=0) -> dict:
+    auction_house = _setup(n_agents, n_rounds, seed)
+    game = Game("bench", auction_house)
+    rng = random.Random(seed + 1)
+    case = CASES[name]
+
+    times = [_time_call(case(auction_house, game, rng)) for _ in range(repeat)]
+    peak = _peak_memory(case(auction_house, game, rng))
+    return {
+        "case": name,
+        "agents": n_agents,
+        "rounds": n_rounds,
+        "median": statistics.median(times),
+        "min": min(times),
+        "peak_bytes": peak,
+    }
+
+
+def _key(result:dict) -> str:
+    return "{}/{}/{}".format(result["case"], result["agents"], result["rounds"])
+
+
+def compare(results:List[dict], baseline:dict, threshold:float) -> List[dict]:
+    """Mark every result slower (median time) or bigger (peak memory) than threshold times its baseline."""
+    previous = {_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+
+        result["time_ratio"] = result["median"] / old["median"] if old["median"] > 0 else None
+        result["memory_ratio"] = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] > 0 else None
+        if any(ratio is not None and ratio > 1.0 + threshold for ratio in (result["time_ratio"], result["memory_ratio"])):
+            result["regression"] = True
+            regressions.append(result)
+    return regressions
+
+
+def _print_result(result:dict):
+    line = "{:<26} {:>6} {:>5}  {:10.3f} ms {:10.3f} ms {:10.1f} KiB".format(
+        result["case"], result["agents"], result["rounds"], result["median"] * 1000, result["min"] * 1000, result["peak_bytes"] / 1024)
+    if result.get("time_ratio") is not None:
+        line += "   time x{:.2f}".format(result["time_ratio"])
+    if result.get("memory_ratio") is not None:
+        line += "  mem x{:.2f}".format(result["memory_ratio"])
+    if result.get("regression"):
+        line += "  REGRESSION"
+    print(line)
+
+
+def _int_list(value:str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv:Optional[List[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the auction house hot paths.")
+    parser.add_argument("--agents", type=_int_list, default=[10, 100, 1000, 10000], help="Comma separated agent counts (default: 10,100,1000,10000)")
+    parser.add_argument("--rounds", type=_int_list, default=[10], help="Comma separated rounds played before measuring (default: 10)")
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma separated cases (default: all): {}".format(", ".join(CASES)))
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per case, the median is compared (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=None, help="Save the results as a baseline JSON file")
+    parser.add_argument("--compare", default=None, help="Compare against a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown or memory growth vs the baseline (default: 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    for name in cases:
+        if name not in CASES:
+            parser.error("unknown case '{}', use one of: {}".format(name, ", ".join(CASES)))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+
+    print("{:<26} {:>6} {:>5}  {:>13} {:>13} {:>14}".format("case", "agents", "rounds", "median", "min", "peak"))
+    results = []
+    for name in cases:
+        for n_rounds in args.rounds:
+            for n_agents in args.agents:
+                result = bench_case(name, n_agents, n_rounds, repeat=args.repeat, seed=args.seed)
+                if baseline is not None:
+                    compare([result], baseline, args.threshold)
+                _print_result(result)
+                results.append(result)
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump({
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "seed": args.seed,
+                "results": results,
+            }, fp, indent=2)
+        print("results saved to: {}".format(args.save))
+
+    regressions = [r for r in results if r.get("regression")]
+    if baseline is not None:
+        print("{} of {} results regressed by more than {:.0%}".format(len(regressions), len(results), args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
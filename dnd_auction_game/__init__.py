@@ -1,2 +1,2 @@
-
 from dnd_auction_game.client import AuctionGameClient
+from dnd_auction_game.simulate import AuctionGameSimulator, simulate_game
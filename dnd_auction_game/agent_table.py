@@ -0,0 +1,150 @@
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class AgentRow(MutableMapping):
+    """Dict-like view of one agent in an AgentTable, works like the old {"gold": ..., "points": ...} dicts."""
+
+    __slots__ = ("_table", "_i")
+
+    FIELDS = ("gold", "points")
+
+    def __init__(self, table:"AgentTable", i:int):
+        self._table = table
+        self._i = i
+
+    def __getitem__(self, key:str) -> int:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return int(self._table._columns[key][self._i])
+
+    def __setitem__(self, key:str, value:int):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        self._table._columns[key][self._i] = value
+
+    def __delitem__(self, key:str):
+        raise TypeError("agent state fields can't be removed")
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class AgentTable(Mapping):
+    """The agent states of a game as NumPy columns, one row per agent in join order.
+
+    Reads like the old dict of dicts (agents[a_id]["gold"], agents.items(), ...),
+    while the round updates work on whole columns (gold, points, priority).
+    The points after each round are kept in a ring buffer of history_size rounds, so
+    the points gained over the last rounds are a difference of two entries.
+    """
+
+    COLUMNS = ("gold", "points", "priority", "joined")
+
+    def __init__(self, history_size:int=100, capacity:int=16):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.history_size = history_size
+        self.n_recorded = 0 # rounds recorded in the points history
+
+        self._columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype=np.int64) for name in self.COLUMNS}
+        self._history = np.zeros((history_size, capacity), dtype=np.int64)
+
+    def _grow(self):
+        capacity = 2 * len(self._columns["gold"])
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=np.int64)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+        history = np.zeros((self.history_size, capacity), dtype=np.int64)
+        history[:, :self._history.shape[1]] = self._history
+        self._history = history
+
+    def add(self, a_id:str) -> int:
+        i = self.index.get(a_id)
+        if i is not None:
+            return i
+
+        i = len(self.ids)
+        if i == len(self._columns["gold"]):
+            self._grow()
+
+        self.ids.append(a_id)
+        self.index[a_id] = i
+        self._columns["joined"][i] = self.n_recorded
+        return i
+
+    # the columns, only the rows that are in use (views, changes write through)
+    @property
+    def gold(self) -> np.ndarray:
+        return self._columns["gold"][:len(self.ids)]
+
+    @property
+    def points(self) -> np.ndarray:
+        return self._columns["points"][:len(self.ids)]
+
+    @property
+    def priority(self) -> np.ndarray:
+        return self._columns["priority"][:len(self.ids)]
+
+    def __getitem__(self, a_id:str) -> AgentRow:
+        return AgentRow(self, self.index[a_id])
+
+    def __contains__(self, a_id) -> bool:
+        return a_id in self.index
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_dict(self) -> Dict[str, dict]:
+        """Plain dict snapshot, the format sent to agents and written to the logs."""
+        return {a_id: {"gold": gold, "points": points}
+                for a_id, gold, points in zip(self.ids, self.gold.tolist(), self.points.tolist())}
+
+    def record_points(self):
+        """Add the current points of every agent to the history, O(1) per agent."""
+        self._history[self.n_recorded % self.history_size, :len(self.ids)] = self.points
+        self.n_recorded += 1
+
+    def _window(self, window:int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # the points after each of the last `window` rounds (n_agents x window), how many of
+        # those rounds each agent has played and its points before the first of them
+        if window >= self.history_size:
+            raise ValueError("window must be smaller than the history size ({})".format(self.history_size))
+
+        n = len(self.ids)
+        w = min(window, self.n_recorded)
+        rows = (self.n_recorded - w + np.arange(w)) % self.history_size
+        block = self._history[rows, :n].T
+
+        played = self.n_recorded - self._columns["joined"][:n]
+        counts = np.minimum(played, w)
+        base_rows = (self.n_recorded - counts - 1) % self.history_size
+        base = np.where(played > counts, self._history[base_rows, np.arange(n)], 0)
+        return block, counts, base
+
+    def average_gains(self, window:int=10) -> np.ndarray:
+        """Average points gained per round over the last window rounds, for every agent."""
+        block, counts, base = self._window(window)
+        if block.shape[1] == 0:
+            return np.zeros(len(self.ids), dtype=np.float64)
+
+        return np.where(counts > 0, (block[:, -1] - base) / np.maximum(counts, 1), 0.0)
+
+    def sparklines(self, window:int=20) -> List[List[int]]:
+        """Points gained since the start of the window, after each of the last window rounds."""
+        block, counts, base = self._window(window)
+        relative = (block - base[:, None]).tolist()
+        return [row[len(row) - c:] if c > 0 else [] for row, c in zip(relative, counts.tolist())]
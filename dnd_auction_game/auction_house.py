@@ -1,13 +1,19 @@
 
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Union
 import random
 from collections import defaultdict
 import json
 import math
-import os
+import time
 
+import numpy as np
 
-def generate_gold_random_walk(n_steps:int) -> List[float]:
+from dnd_auction_game.agent_table import AgentTable
+from dnd_auction_game.log_writer import log_exists
+from dnd_auction_game.protocol import SCHEDULE_DELTA, COMPACT_STATES, encode_round_state
+
+
+def generate_gold_random_walk(n_steps:int, rng:random.Random=random) -> List[float]:
 
     gold_per_round = 1000
     step_size = 150
@@ -15,7 +21,7 @@ def generate_gold_random_walk(n_steps:int) -> List[float]:
 
     gold = [gold_per_round]
     for i in range(n_steps-1):
-        next_gold = gold[-1] + random.randint(-step_size, step_size) - 1
+        next_gold = gold[-1] + rng.randint(-step_size, step_size) - 1
 
         if next_gold < 10:
             next_gold = 10
@@ -26,11 +32,11 @@ def generate_gold_random_walk(n_steps:int) -> List[float]:
         gold.append(next_gold)
 
         if i % 500 == 0:
-            gold[-1] = gold_per_round + random.randint(-step_size // 2, step_size)
+            gold[-1] = gold_per_round + rng.randint(-step_size // 2, step_size)
 
     return gold
 
-def braavos_bank_limit_random_walk(n_steps:int) -> List[int]:
+def braavos_bank_limit_random_walk(n_steps:int, rng:random.Random=random) -> List[int]:
 
     upper_limit_start = 5000
     upper_limit_end = 20000
@@ -38,7 +44,7 @@ def braavos_bank_limit_random_walk(n_steps:int) -> List[int]:
 
     upper_limits = [upper_limit_start]
     for i in range(n_steps-1):
-        next_limit = upper_limits[-1] + random.randint(-step_size, step_size)
+        next_limit = upper_limits[-1] + rng.randint(-step_size, step_size)
 
         if next_limit < 50:
             next_limit = 50
@@ -53,7 +59,7 @@ def braavos_bank_limit_random_walk(n_steps:int) -> List[int]:
 
     return upper_limits
 
-def braavos_bank_interest_rate_random_walk(n_steps:int) -> List[float]:
+def braavos_bank_interest_rate_random_walk(n_steps:int, rng:random.Random=random) -> List[float]:
 
     start_rate = 1.00
     min_rate = 1.0
@@ -62,7 +68,7 @@ def braavos_bank_interest_rate_random_walk(n_steps:int) -> List[float]:
 
     rates = [start_rate]
     for i in range(n_steps-1):
-        next_rate = rates[-1] + random.uniform(-step_size, step_size)
+        next_rate = rates[-1] + rng.uniform(-step_size, step_size)
 
         if next_rate < min_rate:
             next_rate = min_rate
@@ -73,16 +79,19 @@ def braavos_bank_interest_rate_random_walk(n_steps:int) -> List[float]:
         rates.append(next_rate)
 
         if i % 250 == 0:
-            rates[-1] = start_rate + random.uniform(-step_size, step_size)
+            rates[-1] = start_rate + rng.uniform(-step_size, step_size)
 
 
     return rates
 
 
+def _python_rng(seed_seq:np.random.SeedSequence) -> random.Random:
+    return random.Random(int.from_bytes(seed_seq.generate_state(4).tobytes(), "little"))
 
 
 class AuctionHouse:
-    def __init__(self, game_token:str, play_token:str, save_logs=False):
+    def __init__(self, game_token:str, play_token:str, save_logs=False, log_writer=None, compact_logs=False, log_name:str="auction_house_log",
+                 seed:Optional[int]=None):
         self.is_done = False
         self.is_active = False
         
@@ -91,15 +100,16 @@ class AuctionHouse:
         self.game_token = game_token
         self.play_token = play_token
         self.save_logs = save_logs
+        self.log_writer = log_writer # LogWriter, if None the logs are written directly
+        self.compact_logs = compact_logs # log in the compact wire format (read back with game_log.iter_game_log)
+        self.log_name = log_name # logs are written to ./<log_name>_N.jsonln
         self.gold_income = 1000
 
         self.gold_in_pool = 0 # the gold that was removed during the cashback
         self.convert_to_pool_fraction = 0.9 # the fraction of gold that is returned to the hoard
         
-        self.agents = {}
+        self.agents = AgentTable() # gold, points, priority and points history per agent
         self.names = {}
-        self.points_gain_history = {}
-        self._prev_points = {}
         
         self.bank_interest_rate = 1.1
         self.auctions_per_agent = 1.5
@@ -111,36 +121,45 @@ class AuctionHouse:
         self.max_bonus = [11,  2, 16,  8,  21,  2,   5,    7,   3] 
         self.min_bonus = [-2, -8, -5, -5, -10, -4,  -5,  -4,  -4]
 
+        # NumPy only pays off for bigger rounds, below these sizes the rounds are done in plain Python
+        # (see the crossover in benchmarks/microbench.py)
+        self.python_max_auctions = 32
+        self.python_max_bids = 128
+
         self.round_counter = 0
         self.auction_counter = 1
         self.current_auctions = {}
         self.current_rolls = {} 
         self.current_bids = defaultdict(list)
         self.num_rounds_in_game = 10
-        self.priority = {}
         self.current_pool_buys = {}
+        self.last_log_seconds = 0.0 # time spent writing (or queueing) the log in the last prepare_auctions_and_pool
+        self.bid_messages: Dict[str, int] = {} # bid messages received per agent
+        self.late_bids: Dict[str, int] = {} # of those, the ones for a round that was already closed
 
         self.num_rounds_in_game : int = None
         self.gold_income_per_round : List[int] = None
         self.bank_limit_per_round : List[int] = None
         self.bank_interest_per_round : List[float] = None
+        self.set_seed(seed)
         self.set_num_rounds(10)
         
         # set the logfile
         self._find_log_file()
 
-        print("logging to: '{}'".format(self.log_file))
+        if self.save_logs:
+            print("logging to: '{}'".format(self.log_file))
 
     
     def _find_log_file(self):
         if self.log_file is None:            
             i = 1
 
-            f = "./auction_house_log_{}.jsonln".format(i)         
-            f_player_id = "./auction_house_log_player_id_{}.jsonln".format(i)   
-            while os.path.isfile(f):
-                f = "./auction_house_log_{}.jsonln".format(i)
-                f_player_id = "./auction_house_log_player_id_{}.jsonln".format(i)   
+            f = "./{}_{}.jsonln".format(self.log_name, i)         
+            f_player_id = "./{}_player_id_{}.jsonln".format(self.log_name, i)   
+            while log_exists(f) or self._log_pending(f):
+                f = "./{}_{}.jsonln".format(self.log_name, i)
+                f_player_id = "./{}_player_id_{}.jsonln".format(self.log_name, i)   
                 i += 1
 
             self.log_file = f
@@ -148,42 +167,69 @@ class AuctionHouse:
 
 
 
+    def _log_pending(self, path:str) -> bool:
+        # a log that is still queued in the writer might not be on disk yet
+        return self.log_writer is not None and path in self.log_writer.paths
+
+    def set_seed(self, seed:Optional[int]=None):
+        """Restart every random stream of the game from seed (None: fresh entropy).
+
+        self.seed is the seed actually used, for None the fresh entropy, so every game can be replayed.
+        """
+        self._fixed_seed = seed # what reset() starts from again
+        seed_seq = np.random.SeedSequence(seed)
+        self.seed = seed_seq.entropy
+
+        # independent streams, so e.g. a different number of auctions doesn't change the rolls or schedules
+        self._schedule_seq, auction_seq, roll_seq, tie_seq = seed_seq.spawn(4)
+        self.auction_rng = np.random.default_rng(auction_seq) # auction dice, counts and bonuses
+        self.roll_rng = np.random.default_rng(roll_seq) # the hidden rolls
+        self.tie_rng = _python_rng(tie_seq) # priorities and tie-breaks
+
+        # the same for small rounds, generated in plain Python (spawned last, so the streams above stay the same)
+        small_auction_seq, small_roll_seq = seed_seq.spawn(2)
+        self.small_auction_rng = _python_rng(small_auction_seq)
+        self.small_roll_rng = _python_rng(small_roll_seq)
+
     def set_num_rounds(self, num_rounds:int):
         self.num_rounds_in_game = num_rounds
 
-        self.gold_income_per_round = generate_gold_random_walk(num_rounds)
-        self.bank_limit_per_round = braavos_bank_limit_random_walk(num_rounds)
-        self.bank_interest_per_round = braavos_bank_interest_rate_random_walk(num_rounds)
+        # a fresh stream every time, the schedules only depend on the seed and the number of rounds
+        schedule_rng = _python_rng(self._schedule_seq)
+        self.gold_income_per_round = generate_gold_random_walk(num_rounds, schedule_rng)
+        self.bank_limit_per_round = braavos_bank_limit_random_walk(num_rounds, schedule_rng)
+        self.bank_interest_per_round = braavos_bank_interest_rate_random_walk(num_rounds, schedule_rng)
 
 
     def reset(self):
         self.is_done = False
         self.is_active = False
-        self.agents = {}
+        self.agents = AgentTable()
         self.names = {}
-        self.points_gain_history = {}
-        self._prev_points = {}
         self.current_auctions = {}
         self.current_rolls = {} 
         self.current_bids = defaultdict(list)
         self.round_counter = 0
         self.auction_counter = 1
         self.num_rounds_in_game = 10
-        self.priority = {}
         self.gold_in_pool = 0
+        self.bid_messages = {}
+        self.late_bids = {}
+        self.set_seed(self._fixed_seed)
         self.set_num_rounds(10)
         self._find_log_file()
         
     
     def assign_priorities(self):
-        self.priority = {}
+        priority = self.agents.priority
+        priority[:] = 0
         used = set()
-        for a_id in self.agents.keys():
+        for i in range(len(priority)):
             while True:
-                p = random.randint(1, 10**9)
+                p = self.tie_rng.randint(1, 10**9)
                 if p not in used:
                     used.add(p)
-                    self.priority[a_id] = p
+                    priority[i] = p
                     break
         
     def add_agent(self, name:str, a_id:str, player_id:str):
@@ -191,18 +237,16 @@ class AuctionHouse:
             print("Agent {}  id:{} reconnected".format(name, a_id))
             return
 
-        try:
-            with open(self.log_player_id_file, 'a') as fp:
+        if self.save_logs:
+            try:
                 pid = {"player_id": player_id, "agent_id": a_id, "name": name}
-                fp.write("{}\n".format(json.dumps(pid)))
-        except Exception as e:
-            print("error writing player id log:", e)
-            self.save_logs = False
+                self._append_log(self.log_player_id_file, pid)
+            except Exception as e:
+                print("error writing player id log:", e)
+                self.save_logs = False
                     
-        self.agents[a_id] = {"gold": 0, "points": 0}
+        self.agents.add(a_id)
         self.names[a_id] = name
-        self.points_gain_history.setdefault(a_id, [])
-        self._prev_points.setdefault(a_id, 0)
     
     
     def prepare_auctions_and_pool(self):        
@@ -224,18 +268,11 @@ class AuctionHouse:
         interest_rate = self.bank_interest_per_round[rc]
         gold_income = self.gold_income_per_round[rc]
         
-        # update gold for agents
-        for agent in self.agents.values():
-
-            # bank of Braavos gives interest on stored gold
-            interest_available_gold = 0
-            if agent["gold"] >= upper_rate:
-                interest_available_gold = upper_rate
-            else:
-                interest_available_gold = agent["gold"]
-
-            agent["gold"] += int(interest_available_gold * (interest_rate - 1))
-            agent["gold"] += gold_income
+        # update gold for agents, the bank of Braavos gives interest on stored gold (up to the limit)
+        gold = self.agents.gold
+        interest_available_gold = np.minimum(gold, upper_rate)
+        gold += (interest_available_gold * (interest_rate - 1)).astype(np.int64)
+        gold += gold_income
                 
                 
         out_prev_state = {}
@@ -249,7 +286,7 @@ class AuctionHouse:
 
         state = {
             "round": self.round_counter,
-            "states": self.agents,
+            "states": self.agents.to_dict(),
             "auctions": self.current_auctions,
             "prev_auctions": out_prev_state,
             "prev_pool_buys": buy_pool_copy,
@@ -259,56 +296,110 @@ class AuctionHouse:
             "remainder_bank_interest": self.bank_interest_per_round[self.round_counter:],
         }
 
+        self.last_log_seconds = 0.0
         if self.save_logs and self.log_file is not None:
+            log_start = time.perf_counter()
             try:
-                with open(self.log_file, "a") as fp:
-                    fp.write("{}\n".format(json.dumps(state)))
+                if self.compact_logs:
+                    record = encode_round_state(state, (SCHEDULE_DELTA, COMPACT_STATES))
+                else:
+                    record = state
+                self._append_log(self.log_file, record)
             except Exception as e:
                 print("error writing auction log:", e)
                 self.save_logs = False
+            self.last_log_seconds = time.perf_counter() - log_start
         
-        for a_id, info in self.agents.items():
-            current_points = info.get("points", 0)
-            prev_points = self._prev_points.get(a_id, 0)
-            gain = current_points - prev_points
-            history = self.points_gain_history.get(a_id)
-            if history is None:
-                history = []
-            history.append(gain)
-            if len(history) > 100:
-                history = history[-100:]
-            self.points_gain_history[a_id] = history
-            self._prev_points[a_id] = current_points
+        self.agents.record_points()
 
         self.round_counter += 1
         return state
         
   
+    def _append_log(self, path:str, record:dict):
+        if self.log_writer is None:
+            with open(path, "a") as fp:
+                fp.write("{}\n".format(json.dumps(record)))
+            return
+
+        self.log_writer.write(path, record)
+
     def _generate_auctions(self) -> Dict[str, dict]:
         auctions = {}
         rolls = {} # the amount rolled - hidden for agents
         
-        indices = list(range(len(self.die_sizes)))
-                
         n_auctions = int(math.ceil(self.auctions_per_agent*len(self.agents)))
-                
-        for _ in range(n_auctions):
-            i = random.choices(indices, weights=self.die_prob, k=1)[0]            
-            die = self.die_sizes[i]
-            n_dices = random.randint(1, self.max_n_die[i])
-            bonus = random.randint(self.min_bonus[i], self.max_bonus[i])
-                                    
+        if n_auctions == 0:
+            return auctions, rolls
+
+        if n_auctions <= self.python_max_auctions:
+            return self._generate_auctions_python(n_auctions)
+
+        # draw the whole round at once
+        rng = self.auction_rng
+        probs = np.asarray(self.die_prob, dtype=np.float64)
+        kinds = rng.choice(len(self.die_sizes), size=n_auctions, p=probs / probs.sum())
+        dies = np.asarray(self.die_sizes, dtype=np.int64)[kinds]
+        n_dices = rng.integers(1, np.asarray(self.max_n_die, dtype=np.int64)[kinds], endpoint=True)
+        bonuses = rng.integers(np.asarray(self.min_bonus, dtype=np.int64)[kinds],
+                               np.asarray(self.max_bonus, dtype=np.int64)[kinds], endpoint=True)
+
+        # one roll per die, summed per auction
+        dice_rolls = self.roll_rng.integers(1, np.repeat(dies, n_dices), endpoint=True)
+        starts = np.cumsum(n_dices) - n_dices
+        points = np.add.reduceat(dice_rolls, starts) + bonuses
+
+        for die, n, bonus, p in zip(dies.tolist(), n_dices.tolist(), bonuses.tolist(), points.tolist()):
             auction_id = "a{}".format(self.auction_counter)
-            a = {"die": die, "num": n_dices, "bonus": bonus}
-            auctions[auction_id] = a
+            auctions[auction_id] = {"die": die, "num": n, "bonus": bonus}
+            rolls[auction_id] = p
             self.auction_counter += 1
-            
-            points = sum( (random.randint(1, a["die"]) for _ in range(a["num"])) )
-            points += a["bonus"]
-            rolls[auction_id] = points
                     
         return auctions, rolls
 
+    @property
+    def current_round(self) -> int:
+        """The round agents are bidding on now (the last round state that was sent)."""
+        return self.round_counter - 1
+
+    def accept_round(self, a_id:str, round_tag) -> bool:
+        """Count a bid message and check that it is for the current round.
+
+        Messages without a round (older clients) are always accepted.
+        """
+        self.bid_messages[a_id] = self.bid_messages.get(a_id, 0) + 1
+        if round_tag is None or round_tag == self.current_round:
+            return True
+
+        self.late_bids[a_id] = self.late_bids.get(a_id, 0) + 1
+        return False
+
+    def late_bid_stats(self) -> Dict[str, dict]:
+        stats = {}
+        for a_id, n_messages in self.bid_messages.items():
+            n_late = self.late_bids.get(a_id, 0)
+            stats[a_id] = {"messages": n_messages, "late": n_late, "late_rate": n_late / n_messages}
+        return stats
+
+    def _generate_auctions_python(self, n_auctions:int) -> Dict[str, dict]:
+        auctions = {}
+        rolls = {}
+
+        rng = self.small_auction_rng
+        roll_rng = self.small_roll_rng
+        kinds = rng.choices(range(len(self.die_sizes)), weights=self.die_prob, k=n_auctions)
+        for i in kinds:
+            die = self.die_sizes[i]
+            n_dices = rng.randint(1, self.max_n_die[i])
+            bonus = rng.randint(self.min_bonus[i], self.max_bonus[i])
+
+            auction_id = "a{}".format(self.auction_counter)
+            auctions[auction_id] = {"die": die, "num": n_dices, "bonus": bonus}
+            rolls[auction_id] = sum(roll_rng.randint(1, die) for _ in range(n_dices)) + bonus
+            self.auction_counter += 1
+
+        return auctions, rolls
+
     def register_pool_buy(self, a_id:str, points:int):
         if a_id not in self.agents:
             return
@@ -346,7 +437,8 @@ class AuctionHouse:
         if auction_id not in self.current_auctions:
             return
         
-        if a_id not in self.agents:
+        i = self.agents.index.get(a_id)
+        if i is None:
             return
 
         try:
@@ -357,47 +449,140 @@ class AuctionHouse:
         if gold < 1:
             return
 
-                
-        if self.agents[a_id]["gold"] < gold:
+        agents_gold = self.agents.gold
+        if agents_gold[i] < gold:
             return
 
         self.current_bids[auction_id].append( (a_id, gold) )
-        self.agents[a_id]["gold"] -= gold
+        agents_gold[i] -= gold
 
     
-    def process_all_bids(self):        
+    def register_bids(self, a_id:str, bids:Dict[str, int]) -> int:
+        """Register all bids of one message ({auction_id: gold}), returns how many were accepted.
+
+        A message with more bids than there are auctions can't be valid and is rejected
+        as a whole. Otherwise every bid is checked like in register_bid, in order, and
+        the invalid ones (unknown auction, bad amount, not enough gold left) are skipped.
+        """
+        i = self.agents.index.get(a_id)
+        if i is None or not isinstance(bids, dict):
+            return 0
+
+        if len(bids) > len(self.current_auctions):
+            print("agent {} sent {} bids for {} auctions, ignoring them".format(a_id, len(bids), len(self.current_auctions)))
+            return 0
+
+        current_auctions = self.current_auctions
+        current_bids = self.current_bids
+        gold_left = int(self.agents.gold[i])
+        accepted = 0
+        for auction_id, gold in bids.items():
+            auction_id = str(auction_id)
+            if auction_id not in current_auctions:
+                continue
 
-        gold_from_non_winning_bids = 0
-        for auction_id, bids in self.current_bids.items():
-            if not bids:
+            try:
+                gold = int(gold)
+            except (TypeError, ValueError):
                 continue
-            points = self.current_rolls.get(auction_id)
-            if points is None:
+
+            if gold < 1 or gold > gold_left:
                 continue
-            win_amount = max(bids, key=lambda x:x[1])[1]
-            tied = [a_id for a_id, bid in bids if bid == win_amount]
-            if len(tied) == 1:
-                winner = tied[0]
-            else:
-                winner = max(tied, key=lambda a: self.priority.get(a, 0))
-                losers_tied = [a for a in tied if a != winner]
+
+            current_bids[auction_id].append( (a_id, gold) )
+            gold_left -= gold
+            accepted += 1
+
+        self.agents.gold[i] = gold_left
+        return accepted
+
+    
+    def process_all_bids(self):        
+
+        auction_ids = [auction_id for auction_id, bids in self.current_bids.items() if bids and auction_id in self.current_rolls]
+
+        gold_from_non_winning_bids = 0
+        if auction_ids and sum(len(self.current_bids[auction_id]) for auction_id in auction_ids) <= self.python_max_bids:
+            gold_from_non_winning_bids = self._process_bids_python(auction_ids)
+
+        elif auction_ids:
+            agent_index = self.agents.index
+            priority = self.agents.priority
+
+            # all bids as flat arrays, grouped by auction (in bid order within an auction)
+            n_bids = np.array([len(self.current_bids[auction_id]) for auction_id in auction_ids], dtype=np.int64)
+            total_bids = int(n_bids.sum())
+            starts = np.cumsum(n_bids) - n_bids
+            bid_auction = np.repeat(np.arange(len(auction_ids)), n_bids)
+            bid_agent = np.fromiter((agent_index[a_id] for auction_id in auction_ids for a_id, _ in self.current_bids[auction_id]),
+                                    dtype=np.int64, count=total_bids)
+            bid_gold = np.fromiter((gold for auction_id in auction_ids for _, gold in self.current_bids[auction_id]),
+                                   dtype=np.int64, count=total_bids)
+            rolls = np.array([self.current_rolls[auction_id] for auction_id in auction_ids], dtype=np.int64)
+
+            win_amount = np.zeros(len(auction_ids), dtype=np.int64)
+            np.maximum.at(win_amount, bid_auction, bid_gold)
+            is_top = bid_gold == win_amount[bid_auction]
+            n_top = np.bincount(bid_auction[is_top], minlength=len(auction_ids))
+
+            winner = np.full(len(auction_ids), -1, dtype=np.int64)
+            winner[bid_auction[is_top]] = bid_agent[is_top]
+
+            # ties change the priorities, so they are settled one at a time in the original order
+            for i in np.flatnonzero(n_top > 1).tolist():
+                lo, hi = starts[i], starts[i] + n_bids[i]
+                tied = bid_agent[lo:hi][is_top[lo:hi]].tolist()
+                won = max(tied, key=lambda j: priority[j])
+                losers_tied = [j for j in tied if j != won]
                 if losers_tied:
-                    weights = [1.0 / max(self.priority.get(a, 1), 1) for a in losers_tied]
-                    swap_with = random.choices(losers_tied, weights=weights, k=1)[0]
-                    pw = self.priority.get(winner, 0)
-                    pl = self.priority.get(swap_with, 0)
-                    self.priority[winner] = pl
-                    self.priority[swap_with] = pw
+                    weights = [1.0 / max(int(priority[j]), 1) for j in losers_tied]
+                    swap_with = self.tie_rng.choices(losers_tied, weights=weights, k=1)[0]
+                    priority[won], priority[swap_with] = priority[swap_with], priority[won]
+                winner[i] = won
 
             # update now that we know the winners
+            wins = is_top & (bid_agent == winner[bid_auction])
+            points = self.agents.points
+            np.add.at(points, bid_agent[wins], rolls[bid_auction[wins]])
+
+            lost = ~wins
+            back_value = (bid_gold[lost] * self.gold_back_fraction).astype(np.int64)
+            removed_value = np.maximum(0, bid_gold[lost] - back_value)
+            gold_from_non_winning_bids = int(removed_value.sum())
+            np.add.at(self.agents.gold, bid_agent[lost], back_value)
+
+        self.gold_in_pool = max(len(self.agents), int(gold_from_non_winning_bids * self.convert_to_pool_fraction))
+
+    def _process_bids_python(self, auction_ids:List[str]) -> int:
+        # the same as the array version, one bid at a time, returns the gold removed from the losing bids
+        agent_index = self.agents.index
+        priority = self.agents.priority
+        points = self.agents.points
+        gold = self.agents.gold
+
+        gold_from_non_winning_bids = 0
+        for auction_id in auction_ids:
+            bids = self.current_bids[auction_id]
+            win_amount = max(bid for _, bid in bids)
+            tied = [agent_index[a_id] for a_id, bid in bids if bid == win_amount]
+            won = tied[0]
+            if len(tied) > 1:
+                won = max(tied, key=lambda j: priority[j])
+                losers_tied = [j for j in tied if j != won]
+                if losers_tied:
+                    weights = [1.0 / max(int(priority[j]), 1) for j in losers_tied]
+                    swap_with = self.tie_rng.choices(losers_tied, weights=weights, k=1)[0]
+                    priority[won], priority[swap_with] = priority[swap_with], priority[won]
+
+            roll = self.current_rolls[auction_id]
             for a_id, bid in bids:
-                if a_id == winner and bid == win_amount:
-                    self.agents[a_id]["points"] += points
+                i = agent_index[a_id]
+                if i == won and bid == win_amount:
+                    points[i] += roll
                 else:
                     back_value = int(bid * self.gold_back_fraction)
-                    removed_value = max(0, bid - back_value)
-                    gold_from_non_winning_bids += removed_value
-                    self.agents[a_id]["gold"] += back_value
+                    gold_from_non_winning_bids += max(0, bid - back_value)
+                    gold[i] += back_value
 
-        self.gold_in_pool = max(len(self.agents), int(gold_from_non_winning_bids * self.convert_to_pool_fraction))
+        return gold_from_non_winning_bids
         
\ No newline at end of file
@@ -1,20 +1,65 @@
 
 import random
 import asyncio
+import functools
+import itertools
 import json
+import math
 import os
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Optional
 
 import machineid
 import websockets
 from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK
 
+from dnd_auction_game.log_writer import LogWriter
+from dnd_auction_game.protocol import SCHEDULE_DELTA, COMPACT_STATES, RoundStateDecoder
+
+
+# off: no log, buffered: the full round states (written from a background thread),
+# compact: the messages exactly as received (read back with game_log.iter_game_log)
+LOG_MODES = ("off", "buffered", "compact")
+
+_log_counter = itertools.count() # keeps log names unique between clients in one process
+
+
+def default_agent_id(host:str) -> str:
+    if host.lower() == "localhost" or host == "127.0.0.1":
+        return "local_rand_id_{}".format(random.randint(100, 1000000))
+    return machineid.hashed_id('auction-game')
+
+
+def _round_record(raw:str, schedules:Optional[dict], agent_ids:Optional[list], current_agent:str) -> dict:
+    # the buffered log record of a round: the message decoded like it was for the bid callback (the decoder
+    # only ever replaces its schedules and agent ids, so the ones it had then can be passed along)
+    decoder = RoundStateDecoder()
+    decoder.schedules = schedules
+    decoder.agent_ids = agent_ids
+    round_data = decoder.decode(json.loads(raw))
+    round_data["current_agent"] = current_agent
+    return round_data
+
 
 class AuctionGameClient:
-    def __init__(self, host:str, agent_name:str, token:str="play123", player_id:str="<identifier>", port:int=8000):
+    def __init__(self, host:str, agent_name:str, token:str="play123", player_id:str="<identifier>", port:int=8000,
+                 round_time:Optional[float]=None, deadline_margin:float=0.05, default_bid:Optional[dict]=None,
+                 executor:Optional[Executor]=None, log_mode:str="buffered", log_dir:str="logs",
+                 log_writer:Optional[LogWriter]=None, agent_id:Optional[str]=None):
         self.host = host
         self.port = port
         self.player_id = player_id
 
+        # time budget per round (should match the server's AH_ROUND_TIME), None (default) waits for the bid callback forever
+        self.round_time = round_time
+        self.deadline_margin = deadline_margin # answer this much before the round closes
+        self.default_bid = default_bid if default_bid is not None else {} # sent when the bid callback runs out of time
+        self.executor = executor # runs sync bid callbacks, by default one thread for this client
+        self.missed_rounds = 0 # rounds answered with the default bid
+        self._deadline: Optional[float] = None
+        self._busy: Optional[Future] = None
+
         self.token = token
         self.agent_name = agent_name        
         self.log_file = None
@@ -25,34 +70,85 @@ class AuctionGameClient:
         if len(self.agent_name) > 64:
             raise ValueError("Agent name is too long: '{}'".format(self.agent_name))
         
-        if self.host.lower() == "localhost" or self.host == "127.0.0.1":
-            self.agent_id = "local_rand_id_{}".format(random.randint(100, 1000000))
-        else:
-            self.agent_id = machineid.hashed_id('auction-game')
-        
-        if not os.path.isdir("logs"):            
-            print("unable to find ./logs => creating dir.")
-            os.makedirs("logs")
-        
-        n_id = len(os.listdir("logs"))
-        self.log_file = os.path.join("logs", "agent_{}_n{}.jsonl".format(self.agent_id, n_id))
+        # several agents of one machine (see dnd_auction_game.multi_agent) need their own ids
+        self.agent_id = agent_id if agent_id is not None else default_agent_id(self.host)
         
-        print("logging to file: '{}'".format(self.log_file))
+        if log_mode not in LOG_MODES:
+            raise ValueError("Unknown log mode: '{}', use one of {}".format(log_mode, LOG_MODES))
+
+        self.log_mode = log_mode
+        self.log_writer = log_writer # shared writer, if None the client uses its own
+        if log_mode != "off":
+            if not os.path.isdir(log_dir):
+                print("unable to find {} => creating dir.".format(log_dir))
+                os.makedirs(log_dir, exist_ok=True)
+
+            name = "agent_{}_{}_p{}n{}.jsonl".format(self.agent_id, time.strftime("%Y%m%d_%H%M%S"), os.getpid(), next(_log_counter))
+            self.log_file = os.path.join(log_dir, name)
+            print("logging to file: '{}'".format(self.log_file))
 
 
     def run(self, bid_callback):
         asyncio.run(self._internal_run(bid_callback))
         print("<run done>")
 
+    def time_remaining(self) -> float:
+        """Seconds left to answer the current round, can be called from the bid callback."""
+        if self._deadline is None:
+            return math.inf
+        return max(0.0, self._deadline - time.monotonic())
+
+    def _timeout(self) -> Optional[float]:
+        return None if self._deadline is None else self.time_remaining()
+
+    async def _call_bid_callback(self, bid_callback, executor:Executor, *args):
+        # async callbacks run on the event loop, sync ones in the executor, so the socket stays responsive
+        try:
+            if asyncio.iscoroutinefunction(bid_callback):
+                return await asyncio.wait_for(bid_callback(*args), timeout=self._timeout())
+
+            if self._busy is not None and not self._busy.done():
+                # still working on a round that timed out, its answer is lost but it has to finish first
+                try:
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._busy)), timeout=self._timeout())
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    print("<error in the bid callback of an earlier round: {}>".format(e))
+
+            self._busy = executor.submit(bid_callback, *args)
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._busy)), timeout=self._timeout())
+
+        except asyncio.TimeoutError:
+            print("<round {} ran out of time, sending the default bid>".format(args[1]))
+            self.missed_rounds += 1
+            return self.default_bid
+
+    def _log(self, log_writer:LogWriter, raw:str, record:Optional[Callable[[], dict]]):
+        if self.log_mode == "compact":
+            log_writer.write(self.log_file, raw) # includes the sync messages, needed to decode the rounds
+        elif self.log_mode == "buffered" and record is not None:
+            log_writer.write(self.log_file, record)
+
     async def _internal_run(self, bid_callback):
         agent_info = {}
         agent_info["name"] = self.agent_name
         agent_info["a_id"] = self.agent_id
         agent_info["player_id"] = self.player_id[0:128]
+        agent_info["features"] = [SCHEDULE_DELTA, COMPACT_STATES]
+        decoder = RoundStateDecoder()
 
         connection_str = "ws://{}:{}/ws/{}".format(self.host, self.port, self.token)
         print("connecting to: {}".format(connection_str))
 
+        executor = self.executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bid-callback")
+
+        log_writer = self.log_writer
+        if log_writer is None and self.log_mode != "off":
+            log_writer = LogWriter()
+
         try:
             async with websockets.connect(connection_str) as sock:
                 print("<connected to game server>")
@@ -62,28 +158,49 @@ class AuctionGameClient:
                                 
                 while True:
                     round_data_raw = await sock.recv()
-                    round_data = json.loads(round_data_raw)
+                    received = time.monotonic()
+                    round_data = decoder.decode(json.loads(round_data_raw))
+                    if round_data is None:
+                        if log_writer is not None:
+                            self._log(log_writer, round_data_raw, None)
+                        continue
+
+                    if self.round_time is not None:
+                        self._deadline = received + self.round_time - self.deadline_margin
                     
                     round_data["current_agent"] = self.agent_id
-                    with open(self.log_file, "a") as fp:
-                        fp.write("{}\n".format(json.dumps(round_data)))
-                        
+
+                    # decoded again from the raw message on the writer thread, the bid callback may change round_data
+                    record = None
+                    if log_writer is not None and self.log_mode == "buffered":
+                        record = functools.partial(_round_record, round_data_raw, decoder.schedules, decoder.agent_ids, self.agent_id)
 
                     bank_state = {}
                     bank_state["gold_income_per_round"] = round_data["remainder_gold_income"]
                     bank_state["bank_interest_per_round"] = round_data["remainder_bank_interest"]
                     bank_state["bank_limit_per_round"] = round_data["remainder_bank_limit"]
                     
-                    new_bids = bid_callback(self.agent_id, 
-                                            round_data["round"],
-                                            round_data["states"],
-                                            round_data["auctions"],
-                                            round_data["prev_auctions"],
-                                            round_data["pool"],
-                                            round_data["prev_pool_buys"],
-                                            bank_state)    
-
-                    await sock.send(json.dumps(new_bids))
+                    new_bids = await self._call_bid_callback(bid_callback, executor,
+                                                             self.agent_id, 
+                                                             round_data["round"],
+                                                             round_data["states"],
+                                                             round_data["auctions"],
+                                                             round_data["prev_auctions"],
+                                                             round_data["pool"],
+                                                             round_data["prev_pool_buys"],
+                                                             bank_state)    
+
+                    # tag the bids with their round, the server drops them if that round is already over
+                    if isinstance(new_bids, dict):
+                        new_bids = dict(new_bids)
+                        new_bids["round"] = round_data["round"]
+
+                    # logged once the bids are out (or the game closed the connection), the writer thread does the disk io
+                    try:
+                        await sock.send(json.dumps(new_bids))
+                    finally:
+                        if log_writer is not None:
+                            self._log(log_writer, round_data_raw, record)
         
         except ConnectionClosedError:
             print("<ERROR: Connection to server closed>")
@@ -91,6 +208,13 @@ class AuctionGameClient:
         except ConnectionClosedOK:
             pass
 
+        finally:
+            self._deadline = None
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
+            if log_writer is not None and log_writer is not self.log_writer:
+                await asyncio.get_running_loop().run_in_executor(None, log_writer.close)
+
 
 
       
@@ -1,5 +1,6 @@
-from typing import List
+from typing import Callable, Dict, List, Optional
 import asyncio
+import json
 from fastapi import (
     WebSocket,
 )
@@ -8,11 +9,14 @@ from fastapi import (
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        self.features: Dict[WebSocket, frozenset] = {} # wire features negotiated in the handshake
 
-    async def add_connection(self, websocket: WebSocket):
+    async def add_connection(self, websocket: WebSocket, features: frozenset = frozenset()):
         self.active_connections.append(websocket)
+        self.features[websocket] = features
 
     def disconnect(self, websocket: WebSocket):
+        self.features.pop(websocket, None)
         try:
             self.active_connections.remove(websocket)
         except ValueError: #already removed from list
@@ -28,23 +32,44 @@ class ConnectionManager:
                 pass
 
         self.active_connections = []
+        self.features = {}
 
     async def send_message(self, message: dict, websocket: WebSocket):
         await websocket.send_json(message)
 
-    async def broadcast(self, message: dict, timeout: float = 1.0):
-        stale = []
-        for connection in list(self.active_connections):
-            try:
-                await asyncio.wait_for(connection.send_json(message), timeout=timeout)
-            except Exception:
-                stale.append(connection)
+    async def _send_text(self, websocket: WebSocket, text: str, timeout: float):
+        try:
+            await asyncio.wait_for(websocket.send_text(text), timeout=timeout)
+        except Exception:
+            return websocket
+        return None
+
+    async def broadcast(self, message: dict, timeout: float = 1.0, encode: Optional[Callable[[dict, frozenset], dict]] = None) -> dict:
+        # serialize once per wire format and send to everyone at the same time,
+        # so one slow agent can't stall the others.
+        # returns the payload size (bytes) per wire format and the number of dropped connections
+        texts: Dict[frozenset, str] = {}
+        sends = []
+        for ws in list(self.active_connections):
+            features = self.features.get(ws, frozenset())
+            text = texts.get(features)
+            if text is None:
+                out = message if encode is None else encode(message, features)
+                text = json.dumps(out, separators=(",", ":"), ensure_ascii=False)
+                texts[features] = text
+            sends.append(self._send_text(ws, text, timeout))
+
+        results = await asyncio.gather(*sends)
+
+        stale = [ws for ws in results if ws is not None]
         for ws in stale:
             try:
                 await ws.close()
             except:
                 pass
-            try:
-                self.active_connections.remove(ws)
-            except ValueError:
-                pass
+            self.disconnect(ws)
+
+        return {
+            "payload_bytes": {features: len(text.encode("utf-8")) for features, text in texts.items()},
+            "stale": len(stale),
+        }
@@ -0,0 +1,554 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Union
+
+from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.connection_manager import ConnectionManager
+from dnd_auction_game.metrics import (
+    METRICS,
+    AGENTS,
+    BID_LATENCY_SECONDS,
+    CONNECTIONS,
+    LATE_BIDS,
+    PAYLOAD_BYTES,
+    ROUNDS,
+    SPECTATORS,
+    STALE_CONNECTIONS,
+    TICK_ERRORS,
+    TICK_PHASE_SECONDS,
+)
+from dnd_auction_game.protocol import encode_round_state
+from dnd_auction_game.round_scheduler import RoundScheduler
+
+
+def _leadboard_diff(old:dict, new:dict) -> dict:
+    diff = {k: v for k, v in new.items() if k != "players" and old.get(k) != v}
+
+    old_players = {p["id"]: p for p in old["players"]}
+    diff["players"] = [p for p in new["players"] if old_players.get(p["id"]) != p]
+
+    new_ids = set(p["id"] for p in new["players"])
+    removed = [a_id for a_id in old_players if a_id not in new_ids]
+    if removed:
+        diff["removed"] = removed
+
+    return diff
+
+
+class Game:
+    """One auction game: the auction house, its connections, round scheduling and leaderboard."""
+
+    def __init__(self, game_id:str, auction_house:AuctionHouse, max_round_time:float=1.0, metrics_dir:Union[str, None]=None):
+        self.game_id = game_id
+        self.auction_house = auction_house
+        self.connection_manager = ConnectionManager()
+        self.spectator_manager = ConnectionManager() # leaderboard viewers
+        self.round_scheduler = RoundScheduler(max_round_time=max_round_time)
+        self.reset_lock = threading.Lock()
+        self.metrics_dir = metrics_dir # if set, the metrics of every finished game are written there as json
+        self.bid_latency: Dict[str, List[float]] = {} # a_id -> [count, sum, max] of the bid latency in seconds
+
+        self._previous_ranks: Dict[str, int] = {}
+        self._rank_signals: Dict[str, Dict[str, int]] = {}
+        self._last_rank_round: int = -1
+
+        # the leaderboard is computed once per round (or when players join) and served from here
+        self._leadboard_snapshot: Union[dict, None] = None
+        self._leadboard_version: int = 0
+        self._leadboard_etag_prefix = "{:08x}".format(random.getrandbits(32)) # unique per game and server run
+        self._leadboard_pushed: Union[dict, None] = None # the last snapshot sent to the spectators
+        self._leadboard_push_task: Union[asyncio.Task, None] = None
+
+        self._task: Union[asyncio.Task, None] = None
+
+    def reset(self):
+        """Reset auction house and clear leaderboard rank tracking state."""
+        self.auction_house.reset()
+        self.round_scheduler.reset()
+        self.bid_latency = {}
+        METRICS.remove(game=self.game_id)
+        self._previous_ranks = {}
+        self._rank_signals = {}
+        self._last_rank_round = -1
+        self.invalidate_leadboard()
+
+    def reset_if_done(self):
+        if self.auction_house.is_done:
+            with self.reset_lock:
+                if self.auction_house.is_done:
+                    self.reset()
+
+    def compute_leadboard_state(self) -> dict:
+        leadboard = []
+        for a_id, info in self.auction_house.agents.items():
+            name = self.auction_house.names[a_id]
+            leadboard.append(
+                {
+                    "id": a_id,
+                    "name": name,
+                    "points": info["points"],
+                    "gold": info["gold"],
+                }
+            )
+
+        gold_income = 1000
+        interest_rate = 1.0
+        gold_limit = 2000
+        gold_in_pool = max(self.auction_house.gold_in_pool, 0)
+
+        # 20-round change calculations
+        gold_income_change = 0.0
+        interest_rate_change = 0.0
+        gold_limit_change = 0.0
+
+        try:
+            rc = self.auction_house.round_counter
+            max_idx = len(self.auction_house.gold_income_per_round) - 1
+            rc_clamped = min(rc, max_idx) if max_idx >= 0 else 0
+            gold_income = self.auction_house.gold_income_per_round[rc_clamped]
+            interest_rate = self.auction_house.bank_interest_per_round[rc_clamped]
+            gold_limit = self.auction_house.bank_limit_per_round[rc_clamped]
+        
+            # Calculate 20-round change (compare current to 20 rounds ago)
+            if rc >= 20:
+                old_income = self.auction_house.gold_income_per_round[rc - 20]
+                old_interest = self.auction_house.bank_interest_per_round[rc - 20]
+                old_limit = self.auction_house.bank_limit_per_round[rc - 20]
+                if old_income > 0:
+                    gold_income_change = ((gold_income - old_income) / old_income) * 100
+                if old_interest > 0:
+                    interest_rate_change = ((interest_rate - old_interest) / old_interest) * 100
+                if old_limit > 0:
+                    gold_limit_change = ((gold_limit - old_limit) / old_limit) * 100
+        except IndexError:
+            pass
+
+        leadboard.sort(key=lambda x: x["points"], reverse=True)
+        n_players = max(len(leadboard), 1)
+
+        current_round = self.auction_house.round_counter
+
+        if current_round != self._last_rank_round:
+            updated_signals: Dict[str, Dict[str, int]] = {}
+            for a_id, sig in self._rank_signals.items():
+                remaining = sig.get("remaining", 0)
+                move = sig.get("move", 0)
+                if remaining > 1 and move:
+                    updated_signals[a_id] = {"move": move, "remaining": remaining - 1}
+
+            self._rank_signals = updated_signals
+
+            current_ranks: Dict[str, int] = {}
+            for idx, entry in enumerate(leadboard):
+                a_id = entry["id"]
+                rank_index = idx + 1
+                current_ranks[a_id] = rank_index
+                prev_rank = self._previous_ranks.get(a_id)
+                if prev_rank is not None:
+                    if rank_index < prev_rank:
+                        self._rank_signals[a_id] = {"move": 1, "remaining": 5}
+                    elif rank_index > prev_rank:
+                        self._rank_signals[a_id] = {"move": -1, "remaining": 10}
+
+            self._previous_ranks = current_ranks
+            self._last_rank_round = current_round
+
+        # taken from the points history once for all players
+        agents = self.auction_house.agents
+        avg_gains = dict(zip(agents.ids, agents.average_gains(10).tolist()))
+        sparklines = dict(zip(agents.ids, agents.sparklines(20)))
+
+        all_players = []
+        for idx, entry in enumerate(leadboard):
+            a_id = entry["id"]
+            name = entry["name"]
+            points = entry["points"]
+            gold = entry["gold"]
+
+            rank_fraction = (n_players - idx) / n_players
+
+            grade = "F"
+            if points > 10:
+
+                if rank_fraction > 0.89:
+                    grade = "A"
+                elif rank_fraction > 0.75:
+                    grade = "B"
+                elif rank_fraction > 0.60:
+                    grade = "C"
+                elif rank_fraction > 0.40:
+                    grade = "D"
+                else:
+                    grade = "E"
+
+            avg_gain_10 = avg_gains.get(a_id, 0.0)
+
+            sig = self._rank_signals.get(a_id, {})
+            move_val = sig.get("move", 0) if sig.get("remaining", 0) > 0 else 0
+            if move_val > 0:
+                rank_move = "up"
+            elif move_val < 0:
+                rank_move = "down"
+            else:
+                rank_move = "none"
+
+            # cumulative points over the last 20 rounds, JS will normalize
+            sparkline = sparklines.get(a_id, [])
+        
+            all_players.append(
+                {
+                    "id": a_id,
+                    "grade": grade,
+                    "name": name,
+                    "gold": gold,
+                    "points": points,
+                    "avg_gain_10": avg_gain_10,
+                    "rank_move": rank_move,
+                    "sparkline": sparkline,
+                }
+            )
+
+        # Calculate min/max gold for volume bar normalization (relative scaling)
+        gold_values = [p["gold"] for p in all_players] if all_players else [0]
+        max_gold = max(gold_values) if gold_values else 1
+        min_gold = min(gold_values) if gold_values else 0
+
+        return {
+            "players": all_players,
+            "gold_income": gold_income,
+            "interest_rate": interest_rate,
+            "gold_limit": gold_limit,
+            "gold_in_pool": gold_in_pool,
+            "gold_income_change": round(gold_income_change, 1),
+            "interest_rate_change": round(interest_rate_change, 1),
+            "gold_limit_change": round(gold_limit_change, 1),
+            "max_gold": max_gold,
+            "min_gold": min_gold,
+        }
+
+    def invalidate_leadboard(self):
+        self._leadboard_snapshot = None
+
+    def get_leadboard_snapshot(self) -> dict:
+        """Cached leaderboard state, the api payload already serialized and its ETag."""
+        if self._leadboard_snapshot is None:
+            state = self.compute_leadboard_state()
+            payload = {
+                "round": self.auction_house.round_counter,
+                "is_done": self.auction_house.is_done,
+                "bank_state": {
+                    "gold_income_per_round": state["gold_income"],
+                    "bank_interest_per_round": state["interest_rate"],
+                    "bank_limit_per_round": state["gold_limit"],
+                },
+                "gold_in_pool": state["gold_in_pool"],
+                "players": state["players"],
+                "max_gold": state["max_gold"],
+                "min_gold": state["min_gold"],
+                "gold_income_change": state["gold_income_change"],
+                "gold_limit_change": state["gold_limit_change"],
+                "interest_rate_change": state["interest_rate_change"],
+            }
+
+            self._leadboard_version += 1
+            self._leadboard_snapshot = {
+                "version": self._leadboard_version,
+                "etag": '"{}-{}"'.format(self._leadboard_etag_prefix, self._leadboard_version),
+                "state": state,
+                "payload": payload,
+                "body": json.dumps(payload).encode("utf-8"),
+            }
+
+        return self._leadboard_snapshot
+
+    async def _push_leadboard(self):
+        """Send the spectators what changed since the last snapshot they got."""
+        snapshot = self.get_leadboard_snapshot()
+        if self._leadboard_pushed is not None and self._leadboard_pushed["version"] == snapshot["version"]:
+            return
+
+        previous = self._leadboard_pushed
+        self._leadboard_pushed = snapshot
+        if not self.spectator_manager.active_connections:
+            return
+
+        if previous is None:
+            message = {"type": "full", "version": snapshot["version"], "data": snapshot["payload"]}
+        else:
+            message = {
+                "type": "diff",
+                "base": previous["version"],
+                "version": snapshot["version"],
+                "data": _leadboard_diff(previous["payload"], snapshot["payload"]),
+            }
+
+        try:
+            await self.spectator_manager.broadcast(message, timeout=0.5)
+        except Exception as e:
+            print("error in leadboard broadcast:", e)
+
+    def _schedule_leadboard_push(self):
+        # slow spectators must never hold up the game, skip if the last push is still being sent
+        if self._leadboard_push_task is not None and not self._leadboard_push_task.done():
+            return
+
+        try:
+            self.get_leadboard_snapshot()
+        except Exception as e:
+            print("error in leadboard:", e)
+            return
+
+        self._leadboard_push_task = asyncio.create_task(self._push_leadboard())
+
+    async def tick(self):
+        auction_house = self.auction_house
+        connection_manager = self.connection_manager
+        round_scheduler = self.round_scheduler
+
+        while True:
+            if auction_house.is_active:
+                self._run_phase("pool_buys", auction_house.process_pool_buys)
+                self._run_phase("bids", auction_house.process_all_bids)
+                round_data = self._run_phase("prepare", auction_house.prepare_auctions_and_pool)
+                if auction_house.save_logs:
+                    TICK_PHASE_SECONDS.observe(auction_house.last_log_seconds, game=self.game_id, phase="log")
+
+                round_scheduler.start_round()
+                if round_data is not None:
+                    start = time.perf_counter()
+                    try:
+                        sent = await connection_manager.broadcast(round_data, timeout=0.5, encode=encode_round_state)
+                        for features, size in sent["payload_bytes"].items():
+                            PAYLOAD_BYTES.observe(size, game=self.game_id, format="+".join(sorted(features)) or "legacy")
+                        if sent["stale"]:
+                            STALE_CONNECTIONS.inc(sent["stale"], game=self.game_id)
+                    except Exception as e:
+                        print("error in broadcast:", e)
+                        TICK_ERRORS.inc(game=self.game_id, phase="broadcast")
+                    TICK_PHASE_SECONDS.observe(time.perf_counter() - start, game=self.game_id, phase="broadcast")
+
+                ROUNDS.inc(game=self.game_id)
+
+                if auction_house.round_counter >= auction_house.num_rounds_in_game:
+                    auction_house.is_active = False
+                    auction_house.is_done = True
+                    self.dump_metrics()
+
+                    try:
+                        await connection_manager.disconnect_all()
+                    except Exception as e:
+                        print("error in disconnect_all:", e)
+
+                # the round is done, compute the leaderboard for it once
+                self.invalidate_leadboard()
+
+            # also picks up players joining and resets between games
+            self._schedule_leadboard_push()
+
+            if auction_house.is_active:
+                await round_scheduler.wait_for_round()
+            else:
+                await asyncio.sleep(1.0)
+
+    def _run_phase(self, phase:str, fn:Callable):
+        start = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            print("error in {}:".format(fn.__name__), e)
+            TICK_ERRORS.inc(game=self.game_id, phase=phase)
+            return None
+        finally:
+            TICK_PHASE_SECONDS.observe(time.perf_counter() - start, game=self.game_id, phase=phase)
+
+    def record_bid(self, a_id:str):
+        """An agent answered the current round, record how long it took since the round started."""
+        if self.round_scheduler.round_started is None:
+            return
+
+        latency = time.monotonic() - self.round_scheduler.round_started
+        BID_LATENCY_SECONDS.observe(latency, game=self.game_id)
+
+        stats = self.bid_latency.get(a_id)
+        if stats is None:
+            stats = [0, 0.0, 0.0]
+            self.bid_latency[a_id] = stats
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+
+    def record_late_bid(self, a_id:str):
+        LATE_BIDS.inc(game=self.game_id)
+
+    def update_gauges(self):
+        AGENTS.set(len(self.auction_house.agents), game=self.game_id)
+        CONNECTIONS.set(len(self.connection_manager.active_connections), game=self.game_id)
+        SPECTATORS.set(len(self.spectator_manager.active_connections), game=self.game_id)
+
+    def metrics_snapshot(self) -> dict:
+        """The metrics of this game plus per agent bid latency and late bids."""
+        self.update_gauges()
+        agents = {}
+        for a_id, stats in self.auction_house.late_bid_stats().items():
+            count, total, worst = self.bid_latency.get(a_id, [0, 0.0, 0.0])
+            stats["mean_latency"] = total / count if count else None
+            stats["max_latency"] = worst if count else None
+            agents[a_id] = stats
+
+        return {
+            "game_id": self.game_id,
+            "round": self.auction_house.round_counter,
+            "num_rounds": self.auction_house.num_rounds_in_game,
+            "seed": self.auction_house.seed,
+            "metrics": METRICS.snapshot(game=self.game_id),
+            "agents": agents,
+        }
+
+    def dump_metrics(self):
+        if not self.metrics_dir:
+            return
+
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            i = 1
+            path = os.path.join(self.metrics_dir, "metrics_{}_{}.json".format(self.game_id, i))
+            while os.path.exists(path):
+                i += 1
+                path = os.path.join(self.metrics_dir, "metrics_{}_{}.json".format(self.game_id, i))
+
+            with open(path, "w") as fp:
+                json.dump(self.metrics_snapshot(), fp)
+            print("metrics written to: {}".format(path))
+        except Exception as e:
+            print("error writing metrics:", e)
+
+    def is_idle(self) -> bool:
+        """Not running and nobody connected (agents or spectators)."""
+        return (not self.auction_house.is_active and not self.connection_manager.active_connections
+                and not self.spectator_manager.active_connections)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.tick())
+
+    def cancel(self) -> Union[asyncio.Task, None]:
+        """Cancel the tick task (and a pending leaderboard push), returns the tick task if it was running."""
+        if self._leadboard_push_task is not None:
+            self._leadboard_push_task.cancel()
+            self._leadboard_push_task = None
+
+        task = self._task
+        self._task = None
+        if task is not None:
+            task.cancel()
+        return task
+
+    async def stop(self):
+        task = self.cancel()
+        if task is None:
+            return
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+class GameRegistry:
+    """All games hosted by this server, keyed by game id. Each game runs its own tick task.
+
+    Games that stay idle (not running, nobody connected) for idle_timeout seconds are removed,
+    except the pinned ones. Games created from the agent routes wait for a runner to start
+    them, at most max_waiting of those can exist at once, so agents can't use up max_games.
+    """
+
+    def __init__(self, game_factory:Callable[[str], Game], max_games:int=1000, max_waiting:int=100,
+                 idle_timeout:float=300.0, pinned:Sequence[str]=()):
+        self.game_factory = game_factory
+        self.max_games = max_games
+        self.max_waiting = max_waiting
+        self.idle_timeout = idle_timeout
+        self.pinned = set(pinned) # never removed
+        self.games: Dict[str, Game] = {}
+        self.is_running = False
+
+        self._idle_since: Dict[str, float] = {}
+        self._sweep_task: Union[asyncio.Task, None] = None
+
+    def get(self, game_id:str) -> Union[Game, None]:
+        return self.games.get(game_id)
+
+    def _waiting_games(self) -> int:
+        return sum(1 for game_id, game in self.games.items()
+                   if game_id not in self.pinned and game.auction_house.round_counter == 0 and not game.auction_house.is_active)
+
+    def get_or_create(self, game_id:str, waiting:bool=False) -> Union[Game, None]:
+        """The game, created if needed. waiting: created from an agent route, only while below max_waiting."""
+        game = self.games.get(game_id)
+        if game is not None:
+            return game
+
+        if len(self.games) >= self.max_games:
+            return None
+
+        if waiting and self._waiting_games() >= self.max_waiting:
+            return None
+
+        game = self.game_factory(game_id)
+        self.games[game_id] = game
+        if self.is_running:
+            game.start()
+        return game
+
+    def remove(self, game_id:str):
+        """Drop a game: stop its tick task and clear its metrics."""
+        game = self.games.pop(game_id, None)
+        self._idle_since.pop(game_id, None)
+        if game is None:
+            return
+
+        game.cancel()
+        METRICS.remove(game=game_id)
+        print("<removed game {}>".format(game_id))
+
+    def remove_idle(self, now:Union[float, None]=None) -> List[str]:
+        """Remove the games that have been idle for idle_timeout seconds, returns their ids."""
+        now = time.monotonic() if now is None else now
+        removed = []
+        for game_id, game in list(self.games.items()):
+            if game_id in self.pinned or not game.is_idle():
+                self._idle_since.pop(game_id, None)
+                continue
+
+            since = self._idle_since.setdefault(game_id, now)
+            if now - since >= self.idle_timeout:
+                self.remove(game_id)
+                removed.append(game_id)
+        return removed
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 30.0))
+            try:
+                self.remove_idle()
+            except Exception as e:
+                print("error removing idle games:", e)
+
+    def start(self):
+        self.is_running = True
+        for game in self.games.values():
+            game.start()
+        if self._sweep_task is None and self.idle_timeout > 0:
+            self._sweep_task = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        self.is_running = False
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        for game in list(self.games.values()):
+            await game.stop()
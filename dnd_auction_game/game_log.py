@@ -0,0 +1,36 @@
+import json
+from typing import Iterator
+
+from dnd_auction_game.log_writer import find_segments, open_log_file
+from dnd_auction_game.protocol import RoundStateDecoder
+
+
+def iter_log_records(path:str) -> Iterator[dict]:
+    """Stream the raw records of a log, one line at a time.
+
+    path is the log name the server was writing to (e.g. './auction_house_log_3.jsonln'),
+    plain, rotated and compressed logs are all found from it.
+    """
+    segments = find_segments(path)
+    if not segments:
+        raise FileNotFoundError("No log found at: '{}'".format(path))
+
+    for segment in segments:
+        with open_log_file(segment, "rt") as fp:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def iter_game_log(path:str) -> Iterator[dict]:
+    """Stream the rounds of a game log as full round states.
+
+    Compact logs are decoded back to the same dicts the server sends (and old logs
+    contain), with remainder_* schedules and agent ids as keys.
+    """
+    decoder = RoundStateDecoder()
+    for record in iter_log_records(path):
+        round_state = decoder.decode(record)
+        if round_state is not None:
+            yield round_state
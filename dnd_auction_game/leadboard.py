@@ -9,10 +9,12 @@ env = Environment(
     autoescape=select_autoescape(["html", "xml"]),
 )
 
-def generate_leadboard(players, round, is_done, bank_state, gold_in_pool):
+def generate_leadboard(players, round, is_done, bank_state, gold_in_pool, api_url="/api/leadboard", stream_url="/ws_leadboard"):
 
     template = env.get_template("leadboard.html")
     return template.render(
+        api_url=api_url,
+        stream_url=stream_url,
         players=players,
         round=round,
         is_done=is_done,
@@ -0,0 +1,477 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import numpy as np
+import websockets
+from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK, WebSocketException
+
+from dnd_auction_game.protocol import SCHEDULE_DELTA, COMPACT_STATES
+
+
+############################################################################################
+#
+# Load test
+#   Starts the server in a subprocess (or uses one that is already running), connects N
+#   synthetic agents and some leaderboard spectators, starts the game through /ws_run
+#   and measures, from the agents' side, how fast the rounds come and how long the
+#   broadcasts and bids take. The server's own metrics for the game are added to the
+#   results, which are saved as JSON so releases can be compared.
+#
+#   python -m dnd_auction_game.loadtest --agents 100,500,1000 --rounds 30 --out results.json
+#
+############################################################################################
+
+
+BID_PATTERNS = ("none", "single", "random", "all")
+
+
+def make_bids(pattern:str, rng:random.Random, auctions:dict, gold:int) -> dict:
+    """Bids of a synthetic agent, by pattern: none, single (one random auction),
+    random (about half of the auctions) or all (a small bid on every auction)."""
+    auction_ids = list(auctions.keys())
+    if pattern == "none" or not auction_ids or gold <= 0:
+        return {}
+
+    if pattern == "single":
+        return {rng.choice(auction_ids): rng.randint(1, max(1, gold // 10))}
+
+    if pattern == "random":
+        chosen = [auction_id for auction_id in auction_ids if rng.random() < 0.5]
+        share = max(1, gold // (2 * max(1, len(chosen))))
+        return {auction_id: rng.randint(1, share) for auction_id in chosen}
+
+    if pattern == "all":
+        share = max(1, gold // (4 * len(auction_ids)))
+        return {auction_id: rng.randint(1, share) for auction_id in auction_ids}
+
+    raise ValueError("Unknown bid pattern: '{}', use one of {}".format(pattern, BID_PATTERNS))
+
+
+def parse_think_time(spec:str) -> Callable[[random.Random], float]:
+    """Think time distribution in seconds: "0.05" or "fixed:0.05", "uniform:0.01:0.1" or "exp:0.05" (the mean)."""
+    kind, _, args = spec.partition(":")
+    try:
+        if not args:
+            value = float(kind)
+            return lambda rng: value
+
+        values = [float(v) for v in args.split(":")]
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(values[0], values[1])
+        if kind == "exp" and len(values) == 1:
+            return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    except ValueError:
+        pass
+
+    raise ValueError("Unknown think time: '{}', use <seconds>, fixed:<s>, uniform:<min>:<max> or exp:<mean>".format(spec))
+
+
+def summarize(values:List[float]) -> dict:
+    if len(values) == 0:
+        return {"count": 0}
+
+    arr = np.asarray(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99]).tolist()
+    return {"count": len(values), "mean": float(arr.mean()), "p50": p50, "p90": p90, "p99": p99, "max": float(arr.max())}
+
+
+class LoadStats:
+    """What the synthetic agents (of one worker process, or merged) and the spectators saw during one game.
+
+    Times are time.monotonic(), which is the same clock in every process of a machine.
+    """
+
+    def __init__(self):
+        self.received: Dict[int, List[float]] = defaultdict(list) # round -> receive times of the round state
+        self.bid_to_resolution: List[float] = [] # bids sent -> the next round state (with their results) received
+        self.payload_bytes: List[int] = []
+        self.connected = 0
+        self.connect_errors = 0
+        self.dropped = 0 # connections closed with an error during the game
+        self.missing_rounds = 0 # rounds an agent never got
+        self.timed_out = 0 # agents still playing when the test gave up
+        self.spectator_messages = 0
+        self.spectator_bytes = 0
+
+    def merge(self, other:"LoadStats"):
+        for r, times in other.received.items():
+            self.received[r].extend(times)
+        self.bid_to_resolution.extend(other.bid_to_resolution)
+        self.payload_bytes.extend(other.payload_bytes)
+        for name in ("connected", "connect_errors", "dropped", "missing_rounds", "timed_out", "spectator_messages", "spectator_bytes"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def report(self, round_time:float) -> dict:
+        rounds = sorted(self.received)
+        first = [min(self.received[r]) for r in rounds]
+        intervals = np.diff(first).tolist() if len(first) > 1 else []
+        duration = first[-1] - first[0] if len(first) > 1 else 0.0
+
+        # how long after the first agent the others got the same round
+        spread = [t - first_t for r, first_t in zip(rounds, first) for t in self.received[r]]
+
+        return {
+            "rounds_seen": len(rounds),
+            "rounds_per_second": (len(rounds) - 1) / duration if duration > 0 else None,
+            "round_interval_seconds": summarize(intervals),
+            "rounds_over_time": sum(1 for interval in intervals if interval > 1.1 * round_time),
+            "broadcast_spread_seconds": summarize(spread),
+            "bid_to_resolution_seconds": summarize(self.bid_to_resolution),
+            "payload_bytes": summarize(self.payload_bytes),
+            "connected": self.connected,
+            "connect_errors": self.connect_errors,
+            "dropped_connections": self.dropped,
+            "missing_rounds": self.missing_rounds,
+            "timed_out_agents": self.timed_out,
+            "spectator_messages": self.spectator_messages,
+            "spectator_bytes": self.spectator_bytes,
+        }
+
+
+async def _run_agent(url:str, a_id:str, pattern:str, think_time:Callable, rng:random.Random, stats:LoadStats,
+                     connect_limit:asyncio.Semaphore) -> int:
+    agent_info = {"name": a_id, "a_id": a_id, "player_id": "loadtest", "features": [SCHEDULE_DELTA, COMPACT_STATES]}
+    index = None # our column in the compact states
+    rounds = 0
+    sent_at: Optional[float] = None
+
+    try:
+        async with connect_limit:
+            sock = await websockets.connect(url, max_size=None)
+            await sock.send(json.dumps(agent_info))
+    except (OSError, WebSocketException) as e:
+        print("agent {} could not connect: {}".format(a_id, e))
+        stats.connect_errors += 1
+        return 0
+
+    stats.connected += 1
+    try:
+        async with sock:
+            while True:
+                raw = await sock.recv()
+                received = time.monotonic()
+                stats.payload_bytes.append(len(raw))
+
+                # only what a bid needs is looked at, the load generator should not be the bottleneck
+                message = json.loads(raw)
+                if "agent_ids" in message:
+                    index = message["agent_ids"].index(a_id)
+                if "round" not in message:
+                    continue
+
+                stats.received[message["round"]].append(received)
+                if sent_at is not None:
+                    stats.bid_to_resolution.append(received - sent_at)
+                rounds += 1
+
+                delay = think_time(rng)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                gold = message["states"]["gold"][index] if index is not None else 0
+                bids = make_bids(pattern, rng, message["auctions"], gold)
+                await sock.send(json.dumps({"bids": bids, "pool": 0, "round": message["round"]}))
+                sent_at = time.monotonic()
+
+    except ConnectionClosedOK:
+        pass
+
+    except (ConnectionClosedError, OSError) as e:
+        print("agent {} dropped: {}".format(a_id, e))
+        stats.dropped += 1
+
+    return rounds
+
+
+async def _run_agents(url:str, a_ids:List[str], pattern:str, think_time:str, seed:float, n_rounds:int,
+                      connect_concurrency:int, timeout:float) -> LoadStats:
+    think = parse_think_time(think_time)
+    rng = random.Random(seed)
+    stats = LoadStats()
+    connect_limit = asyncio.Semaphore(connect_concurrency)
+
+    agents = [asyncio.create_task(_run_agent(url, a_id, pattern, think, random.Random(rng.random()), stats, connect_limit))
+              for a_id in a_ids]
+    done, pending = await asyncio.wait(agents, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    stats.timed_out = len(pending)
+    for task in done:
+        if task.exception() is None:
+            stats.missing_rounds += max(0, n_rounds - task.result())
+    return stats
+
+
+def _agent_process(*args) -> LoadStats:
+    # entry point of a worker process, every worker runs its share of the agents on its own event loop
+    return asyncio.run(_run_agents(*args))
+
+
+async def _run_spectator(url:str, stats:LoadStats):
+    try:
+        async with websockets.connect(url, max_size=None) as sock:
+            async for message in sock:
+                stats.spectator_messages += 1
+                stats.spectator_bytes += len(message)
+    except (OSError, WebSocketException) as e:
+        print("spectator dropped: {}".format(e))
+
+
+def _get_json(url:str, timeout:float=10.0):
+    with urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+async def _fetch_json(url:str):
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, _get_json, url)
+    except (URLError, OSError, ValueError) as e:
+        print("error fetching {}: {}".format(url, e))
+        return None
+
+
+def _server_summary(snapshot:Optional[dict]) -> Optional[dict]:
+    # the per agent details are left out, they grow with the number of agents
+    if snapshot is None:
+        return None
+
+    agents = snapshot.get("agents", {})
+    return {
+        "round": snapshot.get("round"),
+        "num_rounds": snapshot.get("num_rounds"),
+        "late_bids": sum(a.get("late", 0) for a in agents.values()),
+        "metrics": snapshot.get("metrics"),
+    }
+
+
+async def _wait_for_players(http_base:str, game_id:str, n_agents:int, workers:list, timeout:float) -> int:
+    # the server is the one that knows when every agent has finished its handshake
+    deadline = time.monotonic() + timeout
+    n_players = 0
+    while time.monotonic() < deadline and not all(w.done() for w in workers):
+        games = await _fetch_json("{}/api/games".format(http_base))
+        for game in (games or {}).get("games", []):
+            if game["game_id"] == game_id:
+                n_players = game["num_players"]
+        if n_players >= n_agents:
+            break
+        await asyncio.sleep(0.2)
+    return n_players
+
+
+async def run_game(host:str, port:int, game_id:str, n_agents:int, n_rounds:int, n_spectators:int=0,
+                   pattern:str="random", think_time:str="0", round_time:float=1.0, token:str="play123",
+                   play_token:str="play123", seed:Optional[int]=None, processes:Optional[int]=None,
+                   connect_concurrency:int=100, timeout:Optional[float]=None) -> dict:
+    """Play one game with n_agents synthetic agents on a running server and report what happened.
+
+    The agents are spread over processes worker processes (by default one per core, at
+    most one per 100 agents), so decoding the round states does not slow them down.
+    """
+    if processes is None:
+        processes = min(os.cpu_count() or 1, max(1, n_agents // 100))
+    processes = max(1, min(processes, n_agents))
+    if timeout is None:
+        timeout = 30.0 + n_agents / 50 + 2 * n_rounds * round_time
+
+    rng = random.Random(seed)
+    ws_base = "ws://{}:{}".format(host, port)
+    http_base = "http://{}:{}".format(host, port)
+    url = "{}/ws/{}/{}".format(ws_base, game_id, token)
+    a_ids = ["loadtest_{}_{}".format(game_id, i) for i in range(n_agents)]
+
+    loop = asyncio.get_running_loop()
+    stats = LoadStats()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        start = time.monotonic()
+        workers = [loop.run_in_executor(pool, _agent_process, url, a_ids[i::processes], pattern, think_time, rng.random(),
+                                        n_rounds, connect_concurrency, timeout)
+                   for i in range(processes)]
+        n_players = await _wait_for_players(http_base, game_id, n_agents, workers, timeout=30.0 + n_agents / 50)
+        connect_seconds = time.monotonic() - start
+
+        # the game exists once the first agent has joined it
+        spectators = [asyncio.create_task(_run_spectator("{}/ws_leadboard/{}".format(ws_base, game_id), stats))
+                      for _ in range(n_spectators)]
+
+        game_info = {"num_rounds": n_rounds}
+        if seed is not None:
+            game_info["seed"] = seed
+        async with websockets.connect("{}/ws_run/{}/{}".format(ws_base, game_id, play_token)) as sock:
+            await sock.send(json.dumps(game_info))
+            server_info = json.loads(await sock.recv())
+
+        game_start = time.monotonic()
+        for worker_stats in await asyncio.gather(*workers):
+            stats.merge(worker_stats)
+        game_seconds = time.monotonic() - game_start
+
+        for task in spectators:
+            task.cancel()
+        await asyncio.gather(*spectators, return_exceptions=True)
+
+    result = {
+        "game_id": game_id,
+        "agents": n_agents,
+        "players": server_info.get("num_players", n_players),
+        "rounds": n_rounds,
+        "spectators": n_spectators,
+        "pattern": pattern,
+        "think_time": think_time,
+        "processes": processes,
+        "connect_seconds": connect_seconds,
+        "game_seconds": game_seconds,
+    }
+    result.update(stats.report(round_time))
+    result["server"] = _server_summary(await _fetch_json("{}/api/{}/metrics".format(http_base, game_id)))
+    return result
+
+
+# the directory dnd_auction_game is in, so the server can import it from a checkout that is not installed
+_PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(port:int, app:str="dnd_auction_game.server:app", round_time:float=1.0, workdir:Optional[str]=None,
+                 env:Optional[Dict[str, str]]=None, stderr=None) -> subprocess.Popen:
+    """Start the server in a subprocess, its game logs go to workdir."""
+    server_env = dict(os.environ)
+    server_env["AH_ROUND_TIME"] = str(round_time)
+    python_path = server_env.get("PYTHONPATH")
+    server_env["PYTHONPATH"] = _PACKAGE_PARENT + (os.pathsep + python_path if python_path else "")
+    if env:
+        server_env.update(env)
+
+    cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    print("starting server: {}".format(" ".join(cmd)))
+    return subprocess.Popen(cmd, cwd=workdir, env=server_env, stdout=subprocess.DEVNULL, stderr=stderr)
+
+
+async def wait_for_server(host:str, port:int, timeout:float=30.0, server:Optional[subprocess.Popen]=None) -> bool:
+    deadline = time.monotonic() + timeout
+    loop = asyncio.get_running_loop()
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            return False
+
+        try:
+            await loop.run_in_executor(None, _get_json, "http://{}:{}/api/games".format(host, port), 1.0)
+            return True
+        except (URLError, OSError, ValueError):
+            await asyncio.sleep(0.2)
+    return False
+
+
+def stop_server(server:subprocess.Popen):
+    if server.poll() is None:
+        server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def run_loadtest(agent_counts:List[int], n_rounds:int=20, n_spectators:int=0, pattern:str="random",
+                       think_time:str="0", round_time:float=1.0, host:str="127.0.0.1", port:int=8500,
+                       start:bool=True, app:str="dnd_auction_game.server:app", seed:Optional[int]=None,
+                       processes:Optional[int]=None) -> dict:
+    """One game per agent count, each on a fresh game id, on a server we start (or one that is already running)."""
+    parse_think_time(think_time)
+    if pattern not in BID_PATTERNS:
+        raise ValueError("Unknown bid pattern: '{}', use one of {}".format(pattern, BID_PATTERNS))
+
+    server = None
+    workdir = None
+    server_stderr = None
+    if start:
+        workdir = tempfile.TemporaryDirectory(prefix="auction_loadtest_")
+        server_stderr = open(os.path.join(workdir.name, "server_stderr.log"), "w+")
+        server = start_server(port, app=app, round_time=round_time, workdir=workdir.name, stderr=server_stderr)
+
+    try:
+        if not await wait_for_server(host, port, server=server):
+            output = ""
+            if server_stderr is not None:
+                server_stderr.seek(0)
+                output = server_stderr.read()[-4000:]
+            raise RuntimeError("the server on {}:{} did not come up{}".format(host, port, "\n" + output if output else ""))
+
+        stamp = time.strftime("%Y%m%d%H%M%S")
+        steps = []
+        for n_agents in agent_counts:
+            game_id = "loadtest_{}_{}".format(stamp, n_agents)
+            print("<{} agents, {} rounds, {} spectators>".format(n_agents, n_rounds, n_spectators))
+            step = await run_game(host, port, game_id, n_agents, n_rounds, n_spectators=n_spectators, pattern=pattern,
+                                  think_time=think_time, round_time=round_time, seed=seed, processes=processes)
+            print("  {:.2f} rounds/s, round interval p99 {:.3f}s, broadcast spread p99 {:.3f}s, {} dropped".format(
+                step["rounds_per_second"] or 0.0, step["round_interval_seconds"].get("p99", 0.0),
+                step["broadcast_spread_seconds"].get("p99", 0.0), step["dropped_connections"]))
+            steps.append(step)
+
+    finally:
+        if server is not None:
+            stop_server(server)
+        if server_stderr is not None:
+            server_stderr.close()
+        if workdir is not None:
+            workdir.cleanup()
+
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "app": app if start else "{}:{}".format(host, port),
+        "round_time": round_time,
+        "steps": steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the auction game server with synthetic agents.")
+    parser.add_argument("--agents", "-n", default="100", help="Comma separated agent counts, one game each (default: 100)")
+    parser.add_argument("--rounds", "-r", type=int, default=20, help="Rounds per game (default: 20)")
+    parser.add_argument("--spectators", type=int, default=0, help="Leaderboard connections per game (default: 0)")
+    parser.add_argument("--pattern", choices=BID_PATTERNS, default="random", help="How the agents bid (default: random)")
+    parser.add_argument("--think-time", default="0", help="Think time per round: <s>, fixed:<s>, uniform:<min>:<max> or exp:<mean> (default: 0)")
+    parser.add_argument("--round-time", type=float, default=1.0, help="The server's AH_ROUND_TIME (default: 1.0)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--processes", type=int, default=None, help="Processes running the agents (default: one per core, at most one per 100 agents)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--no-start", action="store_true", help="Use the server already running on --host/--port")
+    parser.add_argument("--app", default="dnd_auction_game.server:app", help="The app to start, e.g. dnd_auction_game.sharded_server:app")
+    parser.add_argument("--out", "-o", default=None, help="Save the results to this JSON file")
+    args = parser.parse_args()
+
+    agent_counts = [int(n) for n in args.agents.split(",") if n.strip()]
+    results = asyncio.run(run_loadtest(agent_counts, n_rounds=args.rounds, n_spectators=args.spectators, pattern=args.pattern,
+                                       think_time=args.think_time, round_time=args.round_time, host=args.host, port=args.port,
+                                       start=not args.no_start, app=args.app, seed=args.seed, processes=args.processes))
+
+    if args.out:
+        with open(args.out, "w") as fp:
+            json.dump(results, fp, indent=2)
+        print("results saved to: {}".format(args.out))
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
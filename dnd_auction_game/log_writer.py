@@ -0,0 +1,186 @@
+import glob
+import gzip
+import json
+import lzma
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Union
+
+
+COMPRESSION_EXTENSIONS = {
+    None: "",
+    "gzip": ".gz",
+    "lzma": ".xz",
+}
+
+
+def segment_path(path:str, index:int, compression:Optional[str]=None) -> str:
+    """Name of the index'th segment of a rotated and/or compressed log."""
+    return "{}.{:04d}{}".format(path, index, COMPRESSION_EXTENSIONS[compression])
+
+
+def find_segments(path:str) -> List[str]:
+    """All files that belong to the log at path, in write order."""
+    files = []
+    if os.path.isfile(path):
+        files.append(path)
+
+    segments = glob.glob(glob.escape(path) + ".[0-9][0-9][0-9][0-9]*")
+    files.extend(sorted(segments))
+    return files
+
+
+def log_exists(path:str) -> bool:
+    return len(find_segments(path)) > 0
+
+
+def open_log_file(path:str, mode:str="rt"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    if path.endswith(".xz"):
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+class LogWriter:
+    """Appends json lines to log files from a background thread.
+
+    Records are queued by write() and made, serialized, written and flushed in batches
+    every flush_interval seconds, so the event loop never waits on the disk.
+
+    With a compression ("gzip" or "lzma") or max_bytes set, a log is written as
+    numbered segments (see segment_path) and a new segment is started once the
+    current one is larger than max_bytes on disk.
+    """
+
+    def __init__(self, flush_interval:float=1.0, fsync:bool=False, compression:Optional[str]=None, max_bytes:int=0):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError("Unknown log compression: '{}'".format(compression))
+
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self._segments: Dict[str, int] = {} # path -> index of the segment we write to
+
+        self.paths = set() # every path we have been asked to write to
+        self._queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(target=self._run, name="auction-log-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, path:str, record:Union[dict, str, Callable[[], Union[dict, str]]]):
+        # NOTE: the record is serialized later from the writer thread, it must not be changed after this call.
+        # a str is taken as an already serialized json line, a callable is called from the writer thread to make the record
+        if self._thread is None:
+            self.start()
+
+        self.paths.add(path)
+        self._queue.put((path, record))
+
+    def close(self):
+        """Write everything that is still queued and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+
+        if thread is None:
+            return
+
+        self._queue.put(None)
+        thread.join()
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = defaultdict(list)
+            deadline = time.monotonic() + self.flush_interval
+
+            # collect records until the flush interval is over (or we are asked to stop)
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if item is None:
+                    done = True
+                    break
+
+                path, record = item
+                batch[path].append(record)
+
+            # one file failing does not stop the others (or the writer thread)
+            for path, records in batch.items():
+                try:
+                    self._write_batch(path, records)
+                except Exception as e:
+                    print("error writing log '{}': {}".format(path, e))
+
+    def _current_file(self, path:str) -> str:
+        if self.compression is None and self.max_bytes <= 0:
+            return path
+
+        index = self._segments.get(path)
+        if index is None:
+            # continue after the segments already on disk (if any)
+            segments = [f for f in find_segments(path) if f != path]
+            index = max(0, len(segments) - 1)
+
+        f = segment_path(path, index, self.compression)
+        if self.max_bytes > 0 and os.path.isfile(f) and os.path.getsize(f) >= self.max_bytes:
+            index += 1
+            f = segment_path(path, index, self.compression)
+
+        self._segments[path] = index
+        return f
+
+    def _write_batch(self, path:str, records:list):
+        # a record that can't be serialized is skipped on its own, the rest of the batch is still written
+        lines = []
+        for record in records:
+            if isinstance(record, str):
+                lines.append(record)
+                continue
+
+            try:
+                if callable(record):
+                    record = record()
+                lines.append(record if isinstance(record, str) else json.dumps(record))
+            except Exception as e:
+                print("error serializing a record for log '{}', skipped: {}".format(path, e))
+
+        if not lines:
+            return
+
+        data = "".join("{}\n".format(line) for line in lines).encode("utf-8")
+
+        # each batch becomes its own compressed stream, gzip and lzma readers handle concatenated streams
+        if self.compression == "gzip":
+            data = gzip.compress(data)
+        elif self.compression == "lzma":
+            data = lzma.compress(data)
+
+        try:
+            with open(self._current_file(path), "ab") as fp:
+                fp.write(data)
+                fp.flush()
+                if self.fsync:
+                    os.fsync(fp.fileno())
+
+        except OSError as e:
+            print("error writing log '{}': {}".format(path, e))
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from typing import Dict, List, Sequence, Tuple
+
+
+############################################################################################
+#
+# Metrics
+#   Minimal counters, gauges and histograms that render in the Prometheus text format
+#   (served on /metrics). Every series can carry labels, e.g. the game id, and the
+#   series of one game can be taken out as a dict (for the per game dumps) or removed.
+#
+############################################################################################
+
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value:str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels:Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join("{}=\"{}\"".format(name, _escape(value)) for name, value in labels) + "}"
+
+
+def _format_value(value:float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name:str, help:str, labelnames:Sequence[str]=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels:Dict[str, object]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError("{} expects the labels {}, got {}".format(self.name, self.labelnames, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _matches(self, key:Tuple[str, ...], match:Dict[str, object]) -> bool:
+        labels = dict(zip(self.labelnames, key))
+        return all(labels.get(name) == str(value) for name, value in match.items())
+
+    def remove(self, **match):
+        """Drop every series whose labels include match."""
+        for key in [key for key in self._series if self._matches(key, match)]:
+            del self._series[key]
+
+    def samples(self, key:Tuple[str, ...]) -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        return [(self.name, tuple(zip(self.labelnames, key)), self._series[key])]
+
+    def snapshot_series(self, key:Tuple[str, ...]):
+        return self._series[key]
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.kind)]
+        for key in list(self._series):
+            for name, labels, value in self.samples(key):
+                lines.append("{}{} {}".format(name, _format_labels(labels), _format_value(value)))
+        return lines
+
+    def snapshot(self, **match) -> List[dict]:
+        return [{"labels": dict(zip(self.labelnames, key)), "value": self.snapshot_series(key)}
+                for key in list(self._series) if self._matches(key, match)]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount:float=1.0, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value:float, **labels):
+        self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name:str, help:str, labelnames:Sequence[str]=(), buckets:Sequence[float]=TIME_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value:float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # [count per bucket (not cumulative), sum, count]
+            series = [[0] * len(self.buckets), 0.0, 0]
+            self._series[key] = series
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def samples(self, key:Tuple[str, ...]):
+        counts, total, count = self._series[key]
+        labels = tuple(zip(self.labelnames, key))
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            out.append((self.name + "_bucket", labels + (("le", _format_value(bound)),), cumulative))
+        out.append((self.name + "_bucket", labels + (("le", "+Inf"),), count))
+        out.append((self.name + "_sum", labels, total))
+        out.append((self.name + "_count", labels, count))
+        return out
+
+    def snapshot_series(self, key:Tuple[str, ...]):
+        counts, total, count = self._series[key]
+        return {"count": count, "sum": total, "buckets": dict(zip([_format_value(b) for b in self.buckets], counts))}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric:_Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError("metric '{}' is already registered".format(metric.name))
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name:str, help:str, labelnames:Sequence[str]=()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name:str, help:str, labelnames:Sequence[str]=()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name:str, help:str, labelnames:Sequence[str]=(), buckets:Sequence[float]=TIME_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self, **match) -> Dict[str, List[dict]]:
+        """The series whose labels include match, as plain data."""
+        return {name: metric.snapshot(**match) for name, metric in self.metrics.items()}
+
+    def remove(self, **match):
+        for metric in self.metrics.values():
+            if all(name in metric.labelnames for name in match):
+                metric.remove(**match)
+
+
+METRICS = MetricsRegistry()
+
+TICK_PHASE_SECONDS = METRICS.histogram("auction_tick_phase_seconds", "Time spent in each phase of a round (log is part of prepare)", ("game", "phase"))
+TICK_ERRORS = METRICS.counter("auction_tick_errors_total", "Errors raised in a phase of a round", ("game", "phase"))
+ROUNDS = METRICS.counter("auction_rounds_total", "Rounds played", ("game",))
+BID_LATENCY_SECONDS = METRICS.histogram("auction_bid_latency_seconds", "Time from the start of a round to the bids of an agent", ("game",))
+LATE_BIDS = METRICS.counter("auction_late_bids_total", "Bid messages for a round that was already closed", ("game",))
+PAYLOAD_BYTES = METRICS.histogram("auction_round_payload_bytes", "Size of the round state sent to the agents, per wire format", ("game", "format"), buckets=SIZE_BUCKETS)
+STALE_CONNECTIONS = METRICS.counter("auction_stale_connections_total", "Agent connections dropped because a send failed or timed out", ("game",))
+AGENTS = METRICS.gauge("auction_agents", "Agents in the game", ("game",))
+CONNECTIONS = METRICS.gauge("auction_connections", "Open agent connections", ("game",))
+SPECTATORS = METRICS.gauge("auction_spectators", "Open leaderboard connections", ("game",))
+EVENT_LOOP_LAG_SECONDS = METRICS.histogram("auction_event_loop_lag_seconds", "How late the event loop wakes up a sleeping task")
+
+
+async def monitor_event_loop_lag(interval:float=0.5):
+    """Runs forever, measuring how much later than asked a sleep returns."""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - start - interval))
@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import os
+import pickle
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from dnd_auction_game.client import LOG_MODES, AuctionGameClient, default_agent_id
+from dnd_auction_game.log_writer import LogWriter
+
+
+############################################################################################
+#
+# Multi agent host
+#   Runs many agents in one process: every agent has its own websocket session with the
+#   game, but they all share one event loop, one pool of threads for the bid callbacks
+#   and one log writer. A few hundred agents cost about as much as one agent process.
+#
+#   python -m dnd_auction_game.multi_agent agent_tiny_bid.py agent_random_walk.py --num 200
+#
+############################################################################################
+
+
+# the arguments every bid callback takes, used to find the callback in an agent script
+BID_CALLBACK_ARGS = ("agent_id", "round", "states", "auctions", "prev_auctions", "pool", "prev_pool_buys", "bank_state")
+
+
+class MultiAgentHost:
+    """Many AuctionGameClients on one event loop.
+
+    Sync bid callbacks run in a shared executor, a thread pool with workers threads unless
+    one is given. With processes > 0, agents added by spec (see load_bid_callback) run in
+    that many worker processes instead: every agent is loaded in one of them and stays
+    there, so it keeps its state between rounds. A shared ProcessPoolExecutor given as
+    executor only takes plain functions the workers can import, add_agent checks this.
+    The callbacks of one agent still run one at a time. Extra keyword arguments
+    (round_time, deadline_margin, default_bid, ...) are passed on to every client.
+    """
+
+    def __init__(self, host:str="localhost", port:int=8000, token:str="play123", player_id:str="<identifier>",
+                 workers:Optional[int]=None, executor:Optional[Executor]=None, log_mode:str="off", log_dir:str="logs",
+                 processes:int=0, **client_kwargs):
+        if log_mode not in LOG_MODES:
+            raise ValueError("Unknown log mode: '{}', use one of {}".format(log_mode, LOG_MODES))
+
+        if processes > 0 and executor is not None:
+            raise ValueError("processes and executor can't be used together")
+
+        self.host = host
+        self.port = port
+        self.token = token
+        self.player_id = player_id
+        self.workers = workers # None: the ThreadPoolExecutor default
+        self.executor = executor
+        self.log_mode = log_mode
+        self.log_dir = log_dir
+        self.processes = processes # worker processes for the agents added by spec, 0: none
+        self.client_kwargs = client_kwargs
+
+        self.log_writer = LogWriter() if log_mode != "off" else None
+        self.clients: List[Tuple[AuctionGameClient, Callable]] = []
+        self._base_id = default_agent_id(host)
+
+    def add_agent(self, agent_name:str, bid_callback:Union[Callable, str], agent_id:Optional[str]=None) -> AuctionGameClient:
+        """Add an agent, bid_callback is the callback or a spec to load it from (see load_bid_callback)."""
+        if agent_id is None:
+            agent_id = "{}_{}".format(self._base_id, len(self.clients))
+
+        if isinstance(bid_callback, str):
+            factory = load_bid_callback(bid_callback) # also checks the spec before it is loaded in a worker
+            if self.processes > 0:
+                bid_callback = _WorkerCallback(_absolute_spec(bid_callback), agent_id)
+            else:
+                bid_callback = factory()
+
+        if isinstance(self.executor, ProcessPoolExecutor):
+            _check_process_callback(bid_callback)
+
+        client = AuctionGameClient(self.host, agent_name, token=self.token, player_id=self.player_id, port=self.port,
+                                   executor=self.executor, log_mode=self.log_mode, log_dir=self.log_dir,
+                                   log_writer=self.log_writer, agent_id=agent_id, **self.client_kwargs)
+        self.clients.append((client, bid_callback))
+        return client
+
+    async def run_async(self):
+        executor = self.executor
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bid-callback")
+
+        # an agent loaded in a worker process has to stay in that process, so every process is its own pool
+        pools = [ProcessPoolExecutor(max_workers=1) for _ in range(self.processes)]
+        n_in_workers = 0
+        for client, bid_callback in self.clients:
+            if isinstance(bid_callback, _WorkerCallback):
+                client.executor = pools[n_in_workers % len(pools)]
+                n_in_workers += 1
+            else:
+                client.executor = executor
+
+        print("<running {} agents>".format(len(self.clients)))
+        try:
+            results = await asyncio.gather(*(client._internal_run(bid_callback) for client, bid_callback in self.clients),
+                                           return_exceptions=True)
+            for (client, _), result in zip(self.clients, results):
+                if isinstance(result, Exception):
+                    print("<agent {} stopped with an error: {}>".format(client.agent_name, result))
+
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
+            for pool in pools:
+                pool.shutdown(wait=False)
+            if self.log_writer is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.log_writer.close)
+
+    def run(self):
+        asyncio.run(self.run_async())
+        print("<run done>")
+
+
+_loaded_modules: Dict[str, object] = {}
+
+
+def _split_spec(spec:str) -> Tuple[str, str]:
+    # "path/to/agent.py:name" -> (path, name), a windows drive ("C:\\...") is not a name
+    target, sep, name = spec.rpartition(":")
+    if not sep or "/" in name or "\\" in name or name.endswith(".py"):
+        return spec, ""
+    return target, name
+
+
+def agent_stem(spec:str) -> str:
+    """Short name of the agent script or module in spec, used to name its agents."""
+    target, _ = _split_spec(spec)
+    if target.endswith(".py"):
+        return os.path.splitext(os.path.basename(target))[0]
+    return target.split(".")[-1]
+
+
+def _load_module(target:str):
+    if not target.endswith(".py"):
+        return importlib.import_module(target)
+
+    path = os.path.abspath(target)
+    module = _loaded_modules.get(path)
+    if module is None:
+        name = "auction_agent_{}".format(len(_loaded_modules))
+        spec = importlib.util.spec_from_file_location(name, path)
+        if spec is None:
+            raise ValueError("Unable to load agent script: '{}'".format(target))
+
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        _loaded_modules[path] = module
+    return module
+
+
+def _check_process_callback(bid_callback:Callable):
+    # the pool gets a pickled copy of the callback on every call: a bound method or callable object would
+    # start from the same state every round, and a function is unpickled by importing its module, which
+    # scripts loaded by path can't be (they have made up names)
+    if not inspect.isfunction(bid_callback):
+        raise ValueError("only plain functions can run in a shared process pool, {!r} would lose its state "
+                         "every round, add agents by spec with processes= instead".format(bid_callback))
+
+    if bid_callback.__module__ in {m.__name__ for m in _loaded_modules.values()}:
+        raise ValueError("bid callbacks from agent scripts loaded by path can't run in a shared process pool, "
+                         "add them by spec with processes= instead")
+
+    try:
+        pickle.dumps(bid_callback)
+    except Exception as e:
+        raise ValueError("bid callback can't be sent to a process pool: {}".format(e))
+
+
+# the bid callbacks of the agents that run in this (worker) process, by agent id
+_worker_callbacks: Dict[str, Callable] = {}
+
+
+class _WorkerCallback:
+    """Stands in for the bid callback of an agent that runs in a worker process.
+
+    Only the spec and agent id are pickled, the callback itself is loaded in the worker on
+    the first call and kept there for the rounds after.
+    """
+
+    def __init__(self, spec:str, agent_id:str):
+        self.spec = spec
+        self.agent_id = agent_id
+
+    def __call__(self, *args):
+        bid_callback = _worker_callbacks.get(self.agent_id)
+        if bid_callback is None:
+            bid_callback = load_bid_callback(self.spec)()
+            _worker_callbacks[self.agent_id] = bid_callback
+
+        result = bid_callback(*args)
+        if inspect.isawaitable(result):
+            result = asyncio.run(result)
+        return result
+
+
+def _absolute_spec(spec:str) -> str:
+    # a worker process may not share our idea of the working directory
+    target, name = _split_spec(spec)
+    if not target.endswith(".py"):
+        return spec
+    target = os.path.abspath(target)
+    return "{}:{}".format(target, name) if name else target
+
+
+def _takes_bid_args(fn, skip:int=0) -> bool:
+    try:
+        params = list(inspect.signature(fn).parameters)
+    except (TypeError, ValueError):
+        return False
+    return tuple(params[skip:]) == BID_CALLBACK_ARGS
+
+
+def _find_bid_callback(module) -> str:
+    # the first function, or method of a class, defined in the module that takes the bid callback arguments
+    for name, obj in vars(module).items():
+        if getattr(obj, "__module__", None) != module.__name__ or name.startswith("_"):
+            continue
+
+        if inspect.isfunction(obj) and _takes_bid_args(obj):
+            return name
+
+        if inspect.isclass(obj):
+            for method_name, method in vars(obj).items():
+                if inspect.isfunction(method) and not method_name.startswith("_") and _takes_bid_args(method, skip=1):
+                    return "{}.{}".format(name, method_name)
+
+    raise ValueError("No bid callback found in '{}'".format(module.__name__))
+
+
+def load_bid_callback(spec:str) -> Callable[[], Callable]:
+    """A factory for the bid callback given by spec.
+
+    spec is "path/to/agent.py" or "package.module", optionally followed by ":name" where
+    name is a function or "Class.method" (every call of the factory then makes a new
+    instance of Class, so agents do not share state). Without a name the first function
+    or method that takes the bid callback arguments is used.
+    """
+    target, name = _split_spec(spec)
+    module = _load_module(target)
+    if not name:
+        name = _find_bid_callback(module)
+
+    class_name, _, method_name = name.rpartition(".")
+    if not class_name:
+        fn = getattr(module, name)
+        return lambda: fn
+
+    cls = getattr(module, class_name)
+    return lambda: getattr(cls(), method_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many auction agents in one process.")
+    parser.add_argument("agents", nargs="+", help="Agent scripts or modules, as path/to/agent.py[:name] or package.module[:name]")
+    parser.add_argument("--num", "-n", type=int, default=4, help="Number of agents, spread evenly over the given agents (default: 4)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--token", default="play123")
+    parser.add_argument("--player-id", default="<identifier>")
+    parser.add_argument("--workers", type=int, default=None, help="Threads running the bid callbacks (default: ThreadPoolExecutor default)")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Run the agents in this many worker processes instead, for CPU heavy bid callbacks (default: 0, threads)")
+    parser.add_argument("--round-time", type=float, default=None,
+                        help="Time budget per round, set to the server's AH_ROUND_TIME to send the default bid when an agent is too slow (default: wait)")
+    parser.add_argument("--log-mode", choices=LOG_MODES, default="off")
+    parser.add_argument("--log-dir", default="logs")
+    args = parser.parse_args()
+
+    host = MultiAgentHost(args.host, port=args.port, token=args.token, player_id=args.player_id, workers=args.workers,
+                          log_mode=args.log_mode, log_dir=args.log_dir, processes=max(0, args.processes),
+                          round_time=args.round_time)
+
+    for i in range(max(1, args.num)):
+        spec = args.agents[i % len(args.agents)]
+        host.add_agent("{}_{}".format(agent_stem(spec)[:56], i), spec)
+
+    try:
+        host.run()
+    except KeyboardInterrupt:
+        print("<interrupt - shutting down>")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,12 @@ import websockets
 
 
 class AuctionGameRunner:
-    def __init__(self, host:str, play_token:str, n_rounds=5, time_per_round:float=1.0, port:int=8000):
+    def __init__(self, host:str, play_token:str, n_rounds=5, time_per_round:float=1.0, port:int=8000, seed:int=None):
         self.host = host
         self.port = port
         self.n_rounds = n_rounds
         self.play_token = play_token
+        self.seed = seed # same seed -> same schedules, auctions and rolls
         
         self.time_per_round = time_per_round
         
@@ -27,6 +28,8 @@ class AuctionGameRunner:
             print("<connected - starting game>")
 
             game_info = {"num_rounds": self.n_rounds}
+            if self.seed is not None:
+                game_info["seed"] = self.seed
             await sock.send(json.dumps(game_info))
 
             server_info_raw = await sock.recv()
@@ -49,8 +52,12 @@ if __name__ == "__main__":
         play_token = sys.argv[2]
     else:
         play_token = "play123"
+
+    seed = None
+    if len(sys.argv) >= 4:
+        seed = int(sys.argv[3])
         
-    runner = AuctionGameRunner(host, n_rounds=n_rounds, play_token=play_token)
+    runner = AuctionGameRunner(host, n_rounds=n_rounds, play_token=play_token, seed=seed)
     print("Running the game for: {} rounds.".format(n_rounds))
     runner.run()
     
@@ -0,0 +1,120 @@
+from typing import Dict, Iterable, List, Optional
+
+
+# optional wire features an agent can ask for in its handshake ("features": [...])
+SCHEDULE_DELTA = "schedule_delta" # send the bank schedules once, then only an offset each round
+COMPACT_STATES = "compact_states" # columnar agent states and bids, keyed by the agent index
+
+SUPPORTED_FEATURES = frozenset([SCHEDULE_DELTA, COMPACT_STATES])
+
+# round state key -> schedule name (same names as in bank_state)
+SCHEDULE_KEYS = {
+    "remainder_gold_income": "gold_income_per_round",
+    "remainder_bank_limit": "bank_limit_per_round",
+    "remainder_bank_interest": "bank_interest_per_round",
+}
+
+
+def parse_features(features) -> frozenset:
+    if not isinstance(features, (list, tuple)):
+        return frozenset()
+
+    return frozenset(f for f in features if f in SUPPORTED_FEATURES)
+
+
+def sync_message(schedules:Dict[str, List], agent_ids:List[str]) -> dict:
+    """Message sent to an agent that (re)connects while a game is running."""
+    return {"schedules": schedules, "agent_ids": agent_ids}
+
+
+def encode_round_state(state:dict, features:Iterable[str]) -> dict:
+    """Turn the full round state from the auction house into the wire format for the given features."""
+    if not features:
+        return state
+
+    out = dict(state)
+    if SCHEDULE_DELTA in features:
+        for key in SCHEDULE_KEYS:
+            del out[key]
+        out["schedule_offset"] = state["round"]
+
+        # the first round carries the whole schedule, later rounds only the offset into it
+        if state["round"] == 0:
+            out["schedules"] = {name: state[key] for key, name in SCHEDULE_KEYS.items()}
+
+    if COMPACT_STATES in features:
+        _encode_compact(state, out)
+
+    return out
+
+
+def _encode_compact(state:dict, out:dict):
+    # agents are never removed during a game, so the order of the states is a stable index
+    agent_ids = list(state["states"].keys())
+    index = {a_id: i for i, a_id in enumerate(agent_ids)}
+
+    if state["round"] == 0:
+        out["agent_ids"] = agent_ids
+
+    agents = state["states"].values()
+    out["states"] = {
+        "gold": [info["gold"] for info in agents],
+        "points": [info["points"] for info in agents],
+    }
+
+    prev_auctions = {}
+    for auction_id, auction in state["prev_auctions"].items():
+        compact = {k: v for k, v in auction.items() if k != "bids"}
+        compact["bids"] = [[index[bid["a_id"]], bid["gold"]] for bid in auction["bids"]]
+        prev_auctions[auction_id] = compact
+    out["prev_auctions"] = prev_auctions
+
+    out["prev_pool_buys"] = [[index[a_id], points] for a_id, points in state["prev_pool_buys"].items()]
+
+
+class RoundStateDecoder:
+    """Client side of encode_round_state: rebuilds the full round state from the wire format."""
+
+    def __init__(self):
+        self.schedules: Optional[Dict[str, List]] = None
+        self.agent_ids: Optional[List[str]] = None
+
+    def decode(self, message:dict) -> Optional[dict]:
+        if "schedules" in message:
+            self.schedules = message["schedules"]
+
+        if "agent_ids" in message:
+            self.agent_ids = message["agent_ids"]
+
+        if "round" not in message:
+            return None # sync message only, nothing to bid on
+
+        if "schedule_offset" in message:
+            if self.schedules is None:
+                raise ValueError("got a round with a schedule offset before the schedules")
+
+            offset = message.pop("schedule_offset")
+            message.pop("schedules", None)
+            for key, name in SCHEDULE_KEYS.items():
+                message[key] = self.schedules[name][offset:]
+
+        if isinstance(message["prev_pool_buys"], list):
+            self._decode_compact(message)
+
+        return message
+
+    def _decode_compact(self, message:dict):
+        if self.agent_ids is None:
+            raise ValueError("got a compact round before the agent ids")
+
+        agent_ids = self.agent_ids
+        message.pop("agent_ids", None)
+
+        columns = message["states"]
+        message["states"] = {a_id: {"gold": gold, "points": points}
+                             for a_id, gold, points in zip(agent_ids, columns["gold"], columns["points"])}
+
+        for auction in message["prev_auctions"].values():
+            auction["bids"] = [{"a_id": agent_ids[i], "gold": gold} for i, gold in auction["bids"]]
+
+        message["prev_pool_buys"] = {agent_ids[i]: points for i, points in message["prev_pool_buys"]}
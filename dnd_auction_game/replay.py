@@ -0,0 +1,191 @@
+import argparse
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from dnd_auction_game.game_log import iter_game_log
+
+
+############################################################################################
+#
+# Columnar replays
+#   Turns a game log (server or client) into flat NumPy arrays, one entry per round,
+#   auction, bid or pool buy. Saved as a directory of .npy files they can be memory
+#   mapped, so scanning many games does not need any JSON parsing.
+#
+############################################################################################
+
+
+def _auction_number(auction_id:str) -> int:
+    # auction ids are "a<counter>"
+    try:
+        return int(auction_id[1:])
+    except ValueError:
+        return -1
+
+
+def log_to_arrays(log_path:str) -> Dict[str, np.ndarray]:
+    agent_index: Dict[str, int] = {}
+    agent_ids: List[str] = []
+
+    rounds, pool = [], []
+    gold_income, bank_limit, bank_interest = [], [], []
+    gold, points = [], []
+
+    auction_round, auction_id, auction_die, auction_num, auction_bonus, auction_reward = [], [], [], [], [], []
+    auction_winner, auction_top_bidder, auction_tied, auction_winning_bid, auction_n_bids = [], [], [], [], []
+    bid_auction, bid_agent, bid_gold = [], [], []
+    pool_buy_round, pool_buy_agent, pool_buy_points = [], [], []
+
+    def index_of(a_id:str) -> int:
+        i = agent_index.get(a_id)
+        if i is None:
+            i = len(agent_ids)
+            agent_index[a_id] = i
+            agent_ids.append(a_id)
+        return i
+
+    for state in iter_game_log(log_path):
+        r = state["round"]
+        rounds.append(r)
+        pool.append(state["pool"])
+
+        # index 0 of the remainder is the value used for this round
+        gold_income.append(state["remainder_gold_income"][0] if state["remainder_gold_income"] else 0)
+        bank_limit.append(state["remainder_bank_limit"][0] if state["remainder_bank_limit"] else 0)
+        bank_interest.append(state["remainder_bank_interest"][0] if state["remainder_bank_interest"] else 0.0)
+
+        round_gold, round_points = {}, {}
+        for a_id, info in state["states"].items():
+            i = index_of(a_id)
+            round_gold[i] = info["gold"]
+            round_points[i] = info["points"]
+        gold.append(round_gold)
+        points.append(round_points)
+
+        # the results of an auction are known in the round after it was offered
+        for a_id_str, auction in state["prev_auctions"].items():
+            m = len(auction_round)
+            bids = auction["bids"]
+
+            auction_round.append(r - 1)
+            auction_id.append(_auction_number(a_id_str))
+            auction_die.append(auction["die"])
+            auction_num.append(auction["num"])
+            auction_bonus.append(auction["bonus"])
+            auction_reward.append(auction["reward"])
+            auction_n_bids.append(len(bids))
+
+            # bids are sorted highest first. A tie on the top bid is settled by the agents' priorities,
+            # which are not in the log, so the winner of a tied auction is unknown (-1, auction_tied is set)
+            if bids:
+                top_bidder = index_of(bids[0]["a_id"])
+                tied = len(bids) > 1 and bids[1]["gold"] == bids[0]["gold"]
+                auction_top_bidder.append(top_bidder)
+                auction_tied.append(tied)
+                auction_winner.append(-1 if tied else top_bidder)
+                auction_winning_bid.append(bids[0]["gold"])
+            else:
+                auction_top_bidder.append(-1)
+                auction_tied.append(False)
+                auction_winner.append(-1)
+                auction_winning_bid.append(0)
+
+            for bid in bids:
+                bid_auction.append(m)
+                bid_agent.append(index_of(bid["a_id"]))
+                bid_gold.append(bid["gold"])
+
+        for a_id, n_points in state["prev_pool_buys"].items():
+            pool_buy_round.append(r - 1)
+            pool_buy_agent.append(index_of(a_id))
+            pool_buy_points.append(n_points)
+
+    n_agents = len(agent_ids)
+    gold_table = np.zeros((len(rounds), n_agents), dtype=np.int64)
+    points_table = np.zeros((len(rounds), n_agents), dtype=np.int64)
+    for r, (round_gold, round_points) in enumerate(zip(gold, points)):
+        gold_table[r, list(round_gold.keys())] = list(round_gold.values())
+        points_table[r, list(round_points.keys())] = list(round_points.values())
+
+    return {
+        "agent_ids": np.array(agent_ids, dtype=str),
+        "round": np.array(rounds, dtype=np.int32),
+        "pool": np.array(pool, dtype=np.int64),
+        "gold_income": np.array(gold_income, dtype=np.int64),
+        "bank_limit": np.array(bank_limit, dtype=np.int64),
+        "bank_interest": np.array(bank_interest, dtype=np.float64),
+        "gold": gold_table,
+        "points": points_table,
+        "auction_round": np.array(auction_round, dtype=np.int32),
+        "auction_id": np.array(auction_id, dtype=np.int64),
+        "auction_die": np.array(auction_die, dtype=np.int16),
+        "auction_num": np.array(auction_num, dtype=np.int16),
+        "auction_bonus": np.array(auction_bonus, dtype=np.int16),
+        "auction_reward": np.array(auction_reward, dtype=np.int32),
+        "auction_winner": np.array(auction_winner, dtype=np.int32),
+        "auction_top_bidder": np.array(auction_top_bidder, dtype=np.int32),
+        "auction_tied": np.array(auction_tied, dtype=bool),
+        "auction_winning_bid": np.array(auction_winning_bid, dtype=np.int64),
+        "auction_n_bids": np.array(auction_n_bids, dtype=np.int32),
+        "bid_auction": np.array(bid_auction, dtype=np.int64),
+        "bid_agent": np.array(bid_agent, dtype=np.int32),
+        "bid_gold": np.array(bid_gold, dtype=np.int64),
+        "pool_buy_round": np.array(pool_buy_round, dtype=np.int32),
+        "pool_buy_agent": np.array(pool_buy_agent, dtype=np.int32),
+        "pool_buy_points": np.array(pool_buy_points, dtype=np.int64),
+    }
+
+
+def save_replay(arrays:Dict[str, np.ndarray], out_path:str):
+    """Save as a single .npz file, or as a directory with one .npy per array (which can be memory mapped)."""
+    if out_path.endswith(".npz"):
+        np.savez(out_path, **arrays)
+        return
+
+    os.makedirs(out_path, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_path, "{}.npy".format(name)), arr)
+
+
+def convert_log(log_path:str, out_path:str) -> Dict[str, np.ndarray]:
+    arrays = log_to_arrays(log_path)
+    save_replay(arrays, out_path)
+    return arrays
+
+
+def load_replay(path:str, mmap:bool=True) -> Dict[str, np.ndarray]:
+    """Load a replay saved by save_replay. Directories are memory mapped (read only) unless mmap is False."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    mmap_mode = "r" if mmap else None
+    arrays = {}
+    for f in sorted(os.listdir(path)):
+        if f.endswith(".npy"):
+            arrays[f[:-4]] = np.load(os.path.join(path, f), mmap_mode=mmap_mode)
+    return arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert auction game logs to columnar NumPy replays.")
+    parser.add_argument("logs", nargs="+", help="Game logs to convert (server or client logs)")
+    parser.add_argument("--out", "-o", default="replays", help="Output directory (default: replays)")
+    parser.add_argument("--npz", action="store_true", help="Save one .npz file per log instead of a directory of .npy files")
+    args = parser.parse_args()
+
+    for log_path in args.logs:
+        name = os.path.basename(log_path)
+        out_path = os.path.join(args.out, name + ".npz" if args.npz else name)
+        if args.npz:
+            os.makedirs(args.out, exist_ok=True)
+
+        arrays = convert_log(log_path, out_path)
+        print("{} -> {} ({} rounds, {} auctions, {} bids)".format(log_path, out_path, len(arrays["round"]),
+                                                                  len(arrays["auction_round"]), len(arrays["bid_gold"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from typing import Dict, Optional, Set
+
+
+class RoundScheduler:
+    """Keeps track of which agents have answered the current round.
+
+    The round is closed as soon as every connected agent has submitted, or when
+    the max round time runs out - whatever comes first.
+    """
+
+    def __init__(self, max_round_time:float=1.0):
+        self.max_round_time = max_round_time
+        self.active_agents: Dict[str, int] = {} # a_id -> number of open connections
+        self.submitted: Set[str] = set()
+        self.round_started: Optional[float] = None # time.monotonic() when the current round was opened
+        self._all_submitted: Optional[asyncio.Event] = None
+
+    def agent_connected(self, a_id:str):
+        self.active_agents[a_id] = self.active_agents.get(a_id, 0) + 1
+
+    def agent_disconnected(self, a_id:str):
+        n = self.active_agents.get(a_id, 0) - 1
+        if n > 0:
+            self.active_agents[a_id] = n
+        else:
+            self.active_agents.pop(a_id, None)
+
+        self._check_done()
+
+    def start_round(self):
+        self.submitted = set()
+        self.round_started = time.monotonic()
+        if self._all_submitted is None:
+            self._all_submitted = asyncio.Event()
+        self._all_submitted.clear()
+
+    def submit(self, a_id:str):
+        self.submitted.add(a_id)
+        self._check_done()
+
+    def reset(self):
+        self.active_agents = {}
+        self.submitted = set()
+        self.round_started = None
+        if self._all_submitted is not None:
+            self._all_submitted.clear()
+
+    def _check_done(self):
+        if self._all_submitted is None or not self.active_agents:
+            return
+
+        if all(a_id in self.submitted for a_id in self.active_agents):
+            self._all_submitted.set()
+
+    async def wait_for_round(self):
+        if self._all_submitted is None:
+            await asyncio.sleep(self.max_round_time)
+            return
+
+        try:
+            await asyncio.wait_for(self._all_submitted.wait(), timeout=self.max_round_time)
+        except asyncio.TimeoutError:
+            pass
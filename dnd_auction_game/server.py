@@ -1,264 +1,107 @@
-import random
-import math
 import os
+import re
 import asyncio
-from typing import List, Dict, Union
-from collections import defaultdict
+from typing import Union
 import json
 from contextlib import asynccontextmanager
-import threading
 
 
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 from fastapi import (
     FastAPI,
+    Request,
     WebSocket,
     WebSocketDisconnect,
 )
 
-from dnd_auction_game.connection_manager import ConnectionManager
 from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.game import Game, GameRegistry
+from dnd_auction_game.log_writer import LogWriter
+from dnd_auction_game.metrics import METRICS, monitor_event_loop_lag
+from dnd_auction_game.protocol import parse_features, sync_message
 from dnd_auction_game.leadboard import generate_leadboard   
 
 
 game_token = os.environ.get("AH_GAME_TOKEN", "play123")
 play_token = os.environ.get("AH_PLAY_TOKEN", "play123")
-auction_house = AuctionHouse(game_token=game_token, play_token=play_token, save_logs=True)
-connection_manager = ConnectionManager()
+log_writer = LogWriter(flush_interval=float(os.environ.get("AH_LOG_FLUSH_INTERVAL", 1.0)),
+                       fsync=os.environ.get("AH_LOG_FSYNC", "0") == "1",
+                       compression=os.environ.get("AH_LOG_COMPRESSION") or None,
+                       max_bytes=int(os.environ.get("AH_LOG_MAX_BYTES", 0)))
+compact_logs = os.environ.get("AH_LOG_COMPACT", "0") == "1"
 
-_previous_ranks: Dict[str, int] = {}
-_rank_signals: Dict[str, Dict[str, int]] = {}
-_last_rank_round: int = -1
-_reset_lock = threading.Lock()
+# max time (in seconds) to wait for bids, the round closes early once every connected agent has answered
+max_round_time = float(os.environ.get("AH_ROUND_TIME", 1.0))
 
+# write the metrics of every finished game to this directory (off if not set)
+metrics_dir = os.environ.get("AH_METRICS_DIR") or None
 
-def _reset_game_state():
-    """Reset auction house and clear leaderboard rank tracking state."""
-    global _previous_ranks, _rank_signals, _last_rank_round
-    auction_house.reset()
-    _previous_ranks = {}
-    _rank_signals = {}
-    _last_rank_round = -1
+# the game used by the routes without a game id
+DEFAULT_GAME_ID = "default"
+_game_id_pattern = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
 
 
-def _compute_leadboard_state():
-    global _previous_ranks, _rank_signals, _last_rank_round
+def _create_game(game_id: str) -> Game:
+    log_name = "auction_house_log" if game_id == DEFAULT_GAME_ID else "auction_house_log_{}".format(game_id)
+    auction_house = AuctionHouse(game_token=game_token, play_token=play_token, save_logs=True, log_writer=log_writer,
+                                 compact_logs=compact_logs, log_name=log_name)
+    return Game(game_id, auction_house, max_round_time=max_round_time, metrics_dir=metrics_dir)
 
-    leadboard = []
-    for a_id, info in auction_house.agents.items():
-        name = auction_house.names[a_id]
-        leadboard.append(
-            {
-                "id": a_id,
-                "name": name,
-                "points": info["points"],
-                "gold": info["gold"],
-            }
-        )
-
-    gold_income = 1000
-    interest_rate = 1.0
-    gold_limit = 2000
-    gold_in_pool = max(auction_house.gold_in_pool, 0)
-
-    # 20-round change calculations
-    gold_income_change = 0.0
-    interest_rate_change = 0.0
-    gold_limit_change = 0.0
-
-    try:
-        rc = auction_house.round_counter
-        max_idx = len(auction_house.gold_income_per_round) - 1
-        rc_clamped = min(rc, max_idx) if max_idx >= 0 else 0
-        gold_income = auction_house.gold_income_per_round[rc_clamped]
-        interest_rate = auction_house.bank_interest_per_round[rc_clamped]
-        gold_limit = auction_house.bank_limit_per_round[rc_clamped]
-        
-        # Calculate 20-round change (compare current to 20 rounds ago)
-        if rc >= 20:
-            old_income = auction_house.gold_income_per_round[rc - 20]
-            old_interest = auction_house.bank_interest_per_round[rc - 20]
-            old_limit = auction_house.bank_limit_per_round[rc - 20]
-            if old_income > 0:
-                gold_income_change = ((gold_income - old_income) / old_income) * 100
-            if old_interest > 0:
-                interest_rate_change = ((interest_rate - old_interest) / old_interest) * 100
-            if old_limit > 0:
-                gold_limit_change = ((gold_limit - old_limit) / old_limit) * 100
-    except IndexError:
-        pass
-
-    leadboard.sort(key=lambda x: x["points"], reverse=True)
-    n_players = max(len(leadboard), 1)
-
-    current_round = auction_house.round_counter
-
-    if current_round != _last_rank_round:
-        updated_signals: Dict[str, Dict[str, int]] = {}
-        for a_id, sig in _rank_signals.items():
-            remaining = sig.get("remaining", 0)
-            move = sig.get("move", 0)
-            if remaining > 1 and move:
-                updated_signals[a_id] = {"move": move, "remaining": remaining - 1}
-
-        _rank_signals = updated_signals
-
-        current_ranks: Dict[str, int] = {}
-        for idx, entry in enumerate(leadboard):
-            a_id = entry["id"]
-            rank_index = idx + 1
-            current_ranks[a_id] = rank_index
-            prev_rank = _previous_ranks.get(a_id)
-            if prev_rank is not None:
-                if rank_index < prev_rank:
-                    _rank_signals[a_id] = {"move": 1, "remaining": 5}
-                elif rank_index > prev_rank:
-                    _rank_signals[a_id] = {"move": -1, "remaining": 10}
-
-        _previous_ranks = current_ranks
-        _last_rank_round = current_round
-
-    all_players = []
-    for idx, entry in enumerate(leadboard):
-        a_id = entry["id"]
-        name = entry["name"]
-        points = entry["points"]
-        gold = entry["gold"]
-
-        rank_fraction = (n_players - idx) / n_players
-
-        grade = "F"
-        if points > 10:
-
-            if rank_fraction > 0.89:
-                grade = "A"
-            elif rank_fraction > 0.75:
-                grade = "B"
-            elif rank_fraction > 0.60:
-                grade = "C"
-            elif rank_fraction > 0.40:
-                grade = "D"
-            else:
-                grade = "E"
-
-        history = auction_house.points_gain_history.get(a_id, [])
-        last_window = history[-10:]
-        avg_gain_10 = float(sum(last_window)) / len(last_window) if last_window else 0.0
-
-        sig = _rank_signals.get(a_id, {})
-        move_val = sig.get("move", 0) if sig.get("remaining", 0) > 0 else 0
-        if move_val > 0:
-            rank_move = "up"
-        elif move_val < 0:
-            rank_move = "down"
-        else:
-            rank_move = "none"
-
-        # Build sparkline data from cumulative points history
-        sparkline = []
-        cumulative = 0
-        for gain in history[-20:]:
-            cumulative += gain
-            sparkline.append(cumulative)
-        # Normalize sparkline relative to first value so it shows trend
-        if sparkline:
-            base = sparkline[0] if sparkline[0] != 0 else 1
-            # Keep raw values for sparkline, JS will normalize
-        
-        all_players.append(
-            {
-                "id": a_id,
-                "grade": grade,
-                "name": name,
-                "gold": gold,
-                "points": points,
-                "avg_gain_10": avg_gain_10,
-                "rank_move": rank_move,
-                "sparkline": sparkline,
-            }
-        )
 
-    # Calculate min/max gold for volume bar normalization (relative scaling)
-    gold_values = [p["gold"] for p in all_players] if all_players else [0]
-    max_gold = max(gold_values) if gold_values else 1
-    min_gold = min(gold_values) if gold_values else 0
-
-    return {
-        "players": all_players,
-        "gold_income": gold_income,
-        "interest_rate": interest_rate,
-        "gold_limit": gold_limit,
-        "gold_in_pool": gold_in_pool,
-        "gold_income_change": round(gold_income_change, 1),
-        "interest_rate_change": round(interest_rate_change, 1),
-        "gold_limit_change": round(gold_limit_change, 1),
-        "max_gold": max_gold,
-        "min_gold": min_gold,
-    }
-
-async def server_tick():
-    while True:
-        if auction_house.is_active:
-            try:
-                auction_house.process_pool_buys()
-            except Exception as e:
-                print("error in process_pool_buys:", e)
+registry = GameRegistry(_create_game, max_games=int(os.environ.get("AH_MAX_GAMES", 1000)),
+                        max_waiting=int(os.environ.get("AH_MAX_WAITING_GAMES", 100)),
+                        idle_timeout=float(os.environ.get("AH_GAME_IDLE_TIMEOUT", 300)), pinned=[DEFAULT_GAME_ID])
+default_game = registry.get_or_create(DEFAULT_GAME_ID)
+auction_house = default_game.auction_house
+connection_manager = default_game.connection_manager
 
-            try:
-                auction_house.process_all_bids()
-            except Exception as e:
-                print("error in process_all_bids:", e)
-
-            round_data = None
-            try:
-                round_data = auction_house.prepare_auctions_and_pool()
-            except Exception as e:
-                print("error in prepare_auctions_and_pool:", e)
 
-            if round_data is not None:
-                try:
-                    await connection_manager.broadcast(round_data, timeout=0.5)
-                except Exception as e:
-                    print("error in broadcast:", e)
+def _find_game(game_id: str, token: str, create: bool = False) -> Union[Game, None]:
+    """The game with the given id, with create the game runner (play token) makes it on first use."""
+    if not _game_id_pattern.match(game_id):
+        return None
 
-            if auction_house.round_counter >= auction_house.num_rounds_in_game:
-                auction_house.is_active = False
-                auction_house.is_done = True
+    if create and token == play_token:
+        return registry.get_or_create(game_id)
+    return registry.get(game_id)
 
-                try:
-                    await connection_manager.disconnect_all()
-                except Exception as e:
-                    print("error in disconnect_all:", e)
 
-        await asyncio.sleep(1.0)
+def _find_waiting_game(game_id: str, token: str) -> Union[Game, None]:
+    """Like _find_game for the agent routes: agents may only create up to AH_MAX_WAITING_GAMES games
+    that have not been started yet (everyone playing knows the game token)."""
+    if not _game_id_pattern.match(game_id):
+        return None
 
+    if token == game_token:
+        return registry.get_or_create(game_id, waiting=True)
+    return registry.get(game_id)
 
 
 @asynccontextmanager
 async def start_app_background_tasks(app: FastAPI):
-    task = asyncio.create_task(server_tick())
+    log_writer.start()
+    registry.start()
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
     yield
-    task.cancel()
-    try:
-        await task
-    except asyncio.CancelledError:
-        pass
+    lag_monitor.cancel()
+    await registry.stop()
+
+    # write out whatever is still queued before we exit
+    log_writer.close()
 
 
 app = FastAPI(lifespan=start_app_background_tasks)
 
 
-@app.websocket("/ws/{token}")
-async def websocket_endpoint_client(websocket: WebSocket, token: str):
-    
+async def _handle_client(websocket: WebSocket, game: Game, token: str):
+    auction_house = game.auction_house
+    connection_manager = game.connection_manager
+    round_scheduler = game.round_scheduler
 
     if token != auction_house.game_token:
         return
 
-    if auction_house.is_done:
-        with _reset_lock:
-            if auction_house.is_done:
-                _reset_game_state()
+    game.reset_if_done()
 
     try:
         await websocket.accept()
@@ -279,6 +122,7 @@ async def websocket_endpoint_client(websocket: WebSocket, token: str):
         agent_info["a_id"] = a_id
         agent_info["name"] = name
         agent_info["player_id"] = player_id
+        features = parse_features(agent_info.get("features"))
         
     except WebSocketDisconnect:
         return
@@ -296,15 +140,34 @@ async def websocket_endpoint_client(websocket: WebSocket, token: str):
         return
     
     try:        
-        await connection_manager.add_connection(websocket)
+        # agents that reconnect mid game have missed the schedules and agent ids sent with the first round
+        if auction_house.is_active and features:
+            await websocket.send_json(sync_message({
+                "gold_income_per_round": auction_house.gold_income_per_round,
+                "bank_limit_per_round": auction_house.bank_limit_per_round,
+                "bank_interest_per_round": auction_house.bank_interest_per_round,
+            }, list(auction_house.agents.keys())))
+
+        await connection_manager.add_connection(websocket, features)
         auction_house.add_agent(agent_info["name"], agent_info["a_id"], agent_info["player_id"])
+        game.invalidate_leadboard()
         a_id = agent_info["a_id"]
+        round_scheduler.agent_connected(a_id)
         
         while auction_house.is_done is False:
             binds = {}
             pool = 0
 
             bids_and_pool = await websocket.receive_json()
+
+            # bids for a round that was already closed would land on the next round's auctions
+            round_tag = bids_and_pool.get("round") if isinstance(bids_and_pool, dict) else None
+            if not auction_house.accept_round(a_id, round_tag):
+                game.record_late_bid(a_id)
+                continue
+
+            round_scheduler.submit(a_id)
+            game.record_bid(a_id)
             try:
                 if bids_and_pool is None or bids_and_pool == {}:
                     continue
@@ -321,8 +184,7 @@ async def websocket_endpoint_client(websocket: WebSocket, token: str):
                     auction_house.register_pool_buy(a_id, pool)
 
                 if isinstance(bids, dict):
-                    for auction_id, gold in bids.items():
-                        auction_house.register_bid(a_id, str(auction_id), gold)
+                    auction_house.register_bids(a_id, bids)
 
             except Exception as e:
                 print("error processing bids:", e)
@@ -333,18 +195,20 @@ async def websocket_endpoint_client(websocket: WebSocket, token: str):
     except WebSocketDisconnect:        
         print("agent: {} disconnected.".format(agent_info["a_id"]))
         connection_manager.disconnect(websocket)
+        round_scheduler.agent_disconnected(agent_info["a_id"])
         return
     
     except:
         print("agent: {} was disconnected due to error.".format(agent_info["a_id"]))
         connection_manager.disconnect(websocket)
+        round_scheduler.agent_disconnected(agent_info["a_id"])
         return
     
 
-@app.websocket("/ws_run/{play_token}")
-async def websocket_endpoint_runner(websocket: WebSocket, play_token: str):
-    
-    print("websocket_endpoint_runner - PLAY TOKEN:", play_token)
+async def _handle_runner(websocket: WebSocket, game: Game, play_token: str):
+    auction_house = game.auction_house
+
+    print("websocket_endpoint_runner - GAME: {} PLAY TOKEN: {}".format(game.game_id, play_token))
 
     if play_token != auction_house.play_token:
         print("wrong play token")
@@ -352,15 +216,25 @@ async def websocket_endpoint_runner(websocket: WebSocket, play_token: str):
     
     if auction_house.is_done:
         print("starting new game")
-        with _reset_lock:
-            if auction_house.is_done:
-                _reset_game_state()
+        game.reset_if_done()
 
     try:
         await websocket.accept()
 
         game_info = await websocket.receive_json()
-        num_rounds = max(1, int(game_info.get("num_rounds", 10)))
+        try:
+            num_rounds = max(1, int(game_info.get("num_rounds", 10)))
+            seed = game_info.get("seed")
+            seed = None if seed is None else int(seed)
+            if seed is not None and seed < 0:
+                raise ValueError("the seed can't be negative")
+        except (AttributeError, TypeError, ValueError) as e:
+            print("game not started, bad game info: {}".format(e))
+            await websocket.send_json({"ok": False, "error": "bad game info: {}".format(e)})
+            await websocket.close()
+            return
+
+        auction_house.set_seed(seed)
         auction_house.num_rounds_in_game = num_rounds
         auction_house.set_num_rounds(auction_house.num_rounds_in_game)
 
@@ -369,6 +243,7 @@ async def websocket_endpoint_runner(websocket: WebSocket, play_token: str):
         game_info = {
             "game_token": auction_house.game_token,
             "num_players": len(auction_house.agents),
+            "seed": auction_house.seed,
         }
 
         await websocket.send_json(game_info)        
@@ -386,62 +261,194 @@ async def websocket_endpoint_runner(websocket: WebSocket, play_token: str):
         await websocket.close()
     except:
         print("game not started due to error.")
-        
 
-@app.get("/reset/{play_token}")
-async def reset_server(play_token: str):
-    print("reset_server - PLAY TOKEN:", play_token)
-    if play_token != auction_house.play_token:
+
+async def _handle_spectator(websocket: WebSocket, game: Game):
+    spectator_manager = game.spectator_manager
+    try:
+        await websocket.accept()
+        snapshot = game.get_leadboard_snapshot()
+        await websocket.send_json({"type": "full", "version": snapshot["version"], "data": snapshot["payload"]})
+        await spectator_manager.add_connection(websocket)
+
+        # spectators never send anything, this just waits for them to leave
+        while True:
+            await websocket.receive_text()
+
+    except WebSocketDisconnect:
+        pass
+
+    except Exception:
+        pass
+
+    spectator_manager.disconnect(websocket)
+
+
+async def _handle_reset(game: Game, play_token: str):
+    print("reset_server - GAME: {} PLAY TOKEN: {}".format(game.game_id, play_token))
+    if play_token != game.auction_house.play_token:
         return {"ok": False, "error": "wrong play token"}
 
     # Disconnect any existing clients and reset state
     try:
-        await connection_manager.disconnect_all()
+        await game.connection_manager.disconnect_all()
     except Exception as e:
         print("error in disconnect_all during reset:", e)
 
-    _reset_game_state()
+    game.reset()
     print("<server reset>")
     return {"ok": True}
 
-@app.get("/")
-async def get():    
-    state = _compute_leadboard_state()
+
+def _leadboard_page(game: Game, api_url: str, stream_url: str):
+    snapshot = game.get_leadboard_snapshot()
+    state = snapshot["state"]
 
     return HTMLResponse(
         generate_leadboard(
             state["players"],
-            auction_house.round_counter,
-            auction_house.is_done,
-            bank_state={
-                "gold_income_per_round": state["gold_income"],
-                "bank_interest_per_round": state["interest_rate"],
-                "bank_limit_per_round": state["gold_limit"],
-            },
+            snapshot["payload"]["round"],
+            snapshot["payload"]["is_done"],
+            bank_state=snapshot["payload"]["bank_state"],
             gold_in_pool=state["gold_in_pool"],
+            api_url=api_url,
+            stream_url=stream_url,
         )
     )
 
 
+def _leadboard_response(game: Game, request: Request):
+    snapshot = game.get_leadboard_snapshot()
+    headers = {"ETag": snapshot["etag"], "Cache-Control": "no-cache"}
+
+    if request.headers.get("if-none-match") == snapshot["etag"]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=snapshot["body"], media_type="application/json", headers=headers)
+
+
+def _not_found():
+    return Response(content=json.dumps({"ok": False, "error": "unknown game"}), status_code=404, media_type="application/json")
+
+
+@app.websocket("/ws/{token}")
+async def websocket_endpoint_client(websocket: WebSocket, token: str):
+    await _handle_client(websocket, default_game, token)
+
+
+@app.websocket("/ws/{game_id}/{token}")
+async def websocket_endpoint_game_client(websocket: WebSocket, game_id: str, token: str):
+    game = _find_waiting_game(game_id, token)
+    if game is None:
+        return
+    await _handle_client(websocket, game, token)
+
+
+@app.websocket("/ws_run/{play_token}")
+async def websocket_endpoint_runner(websocket: WebSocket, play_token: str):
+    await _handle_runner(websocket, default_game, play_token)
+
+
+@app.websocket("/ws_run/{game_id}/{play_token}")
+async def websocket_endpoint_game_runner(websocket: WebSocket, game_id: str, play_token: str):
+    game = _find_game(game_id, play_token, create=True)
+    if game is None:
+        return
+    await _handle_runner(websocket, game, play_token)
+
+
+@app.websocket("/ws_leadboard")
+async def websocket_endpoint_leadboard(websocket: WebSocket):
+    await _handle_spectator(websocket, default_game)
+
+
+@app.websocket("/ws_leadboard/{game_id}")
+async def websocket_endpoint_game_leadboard(websocket: WebSocket, game_id: str):
+    game = registry.get(game_id)
+    if game is None:
+        return
+    await _handle_spectator(websocket, game)
+
+
+@app.get("/reset/{play_token}")
+async def reset_server(play_token: str):
+    return await _handle_reset(default_game, play_token)
+
+
+@app.get("/reset/{game_id}/{play_token}")
+async def reset_game(game_id: str, play_token: str):
+    game = registry.get(game_id)
+    if game is None:
+        return {"ok": False, "error": "unknown game"}
+    return await _handle_reset(game, play_token)
+
+
+@app.get("/")
+async def get():    
+    return _leadboard_page(default_game, "/api/leadboard", "/ws_leadboard")
+
+
+@app.get("/game/{game_id}")
+async def get_game(game_id: str):
+    game = registry.get(game_id)
+    if game is None:
+        return _not_found()
+    return _leadboard_page(game, "/api/{}/leadboard".format(game_id), "/ws_leadboard/{}".format(game_id))
+
+
 @app.get("/api/leadboard")
-async def get_leadboard_data():
-    state = _compute_leadboard_state()
-
-    return {
-        "round": auction_house.round_counter,
-        "is_done": auction_house.is_done,
-        "bank_state": {
-            "gold_income_per_round": state["gold_income"],
-            "bank_interest_per_round": state["interest_rate"],
-            "bank_limit_per_round": state["gold_limit"],
-        },
-        "gold_in_pool": state["gold_in_pool"],
-        "players": state["players"],
-        "max_gold": state["max_gold"],
-        "min_gold": state["min_gold"],
-        "gold_income_change": state["gold_income_change"],
-        "gold_limit_change": state["gold_limit_change"],
-        "interest_rate_change": state["interest_rate_change"],
-    }
+async def get_leadboard_data(request: Request):
+    return _leadboard_response(default_game, request)
+
+
+@app.get("/api/games")
+async def get_games():
+    games = []
+    for game_id, game in registry.games.items():
+        games.append(
+            {
+                "game_id": game_id,
+                "round": game.auction_house.round_counter,
+                "num_rounds": game.auction_house.num_rounds_in_game,
+                "num_players": len(game.auction_house.agents),
+                "is_active": game.auction_house.is_active,
+                "is_done": game.auction_house.is_done,
+            }
+        )
+    return {"games": games}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    for game in registry.games.values():
+        game.update_gauges()
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/{game_id}/metrics")
+async def get_game_metrics(game_id: str):
+    game = registry.get(game_id)
+    if game is None:
+        return _not_found()
+    return game.metrics_snapshot()
+
+
+@app.get("/api/late_bids")
+async def get_late_bids():
+    return {"round": default_game.auction_house.current_round, "agents": default_game.auction_house.late_bid_stats()}
+
+
+@app.get("/api/{game_id}/late_bids")
+async def get_game_late_bids(game_id: str):
+    game = registry.get(game_id)
+    if game is None:
+        return _not_found()
+    return {"round": game.auction_house.current_round, "agents": game.auction_house.late_bid_stats()}
 
 
+@app.get("/api/{game_id}/leadboard")
+async def get_game_leadboard_data(game_id: str, request: Request):
+    game = registry.get(game_id)
+    if game is None:
+        return _not_found()
+    return _leadboard_response(game, request)
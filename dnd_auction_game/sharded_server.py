@@ -0,0 +1,393 @@
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Sequence, Tuple, Union
+from urllib.error import HTTPError, URLError
+from urllib.request import Request as UrlRequest, urlopen
+
+import websockets
+from fastapi import (
+    FastAPI,
+    Request,
+    WebSocket,
+)
+from fastapi.responses import Response
+
+
+############################################################################################
+#
+# Sharded server
+#   Runs one dnd_auction_game.server worker process per core and puts a thin front end
+#   in front of them. Every game id is assigned to one worker the first time it is seen
+#   (the worker with the fewest games) and all its traffic is relayed to that worker, so
+#   round processing for different games runs in parallel on all cores.
+#
+#   uvicorn dnd_auction_game.sharded_server:app
+#
+############################################################################################
+
+
+DEFAULT_GAME_ID = "default" # same as in dnd_auction_game.server
+
+# same tokens as the workers (they inherit our environment), only these may create games
+game_token = os.environ.get("AH_GAME_TOKEN", "play123")
+play_token = os.environ.get("AH_PLAY_TOKEN", "play123")
+
+num_workers = max(1, int(os.environ.get("AH_WORKERS", os.cpu_count() or 1)))
+worker_base_port = int(os.environ.get("AH_WORKER_BASE_PORT", 8100))
+worker_host = "127.0.0.1"
+# how often the routes are checked against the games the workers still have
+route_sync_interval = float(os.environ.get("AH_ROUTE_SYNC_INTERVAL", 30.0))
+_game_id_pattern = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class ShardRouter:
+    """Sticky game id -> worker routing table.
+
+    Only assign() adds games (used on the token checked routes), so requests for random
+    game ids can't fill the table or skew the balance between the workers. Games a worker
+    no longer has (it removes idle games) are released by sync(), so the balance follows
+    the games that are still there.
+    """
+
+    def __init__(self, n_workers:int, pinned:Sequence[str]=()):
+        self.n_workers = n_workers
+        self.pinned = set(pinned) # never released
+        self.routes: Dict[str, int] = {}
+        self.games_per_worker: List[int] = [0] * n_workers
+        self._assigned_at: Dict[str, float] = {}
+
+    def get(self, game_id:str) -> Union[int, None]:
+        return self.routes.get(game_id)
+
+    def assign(self, game_id:str) -> int:
+        worker = self.routes.get(game_id)
+        if worker is None:
+            worker = min(range(self.n_workers), key=lambda w: self.games_per_worker[w])
+            self.routes[game_id] = worker
+            self.games_per_worker[worker] += 1
+            self._assigned_at[game_id] = time.monotonic()
+        return worker
+
+    def release(self, game_id:str):
+        worker = self.routes.pop(game_id, None)
+        self._assigned_at.pop(game_id, None)
+        if worker is not None:
+            self.games_per_worker[worker] -= 1
+
+    def sync(self, worker:int, live_game_ids:Sequence[str], grace:float, now:Union[float, None]=None) -> List[str]:
+        """Release the games routed to worker that it doesn't have anymore, returns their ids.
+
+        Games assigned less than grace seconds ago are kept, the worker might not have created them yet.
+        """
+        now = time.monotonic() if now is None else now
+        live = set(live_game_ids)
+        released = [game_id for game_id, w in self.routes.items()
+                    if w == worker and game_id not in live and game_id not in self.pinned
+                    and now - self._assigned_at.get(game_id, now) >= grace]
+        for game_id in released:
+            self.release(game_id)
+        return released
+
+
+router = ShardRouter(num_workers, pinned=[DEFAULT_GAME_ID])
+router.assign(DEFAULT_GAME_ID)
+_workers: List[subprocess.Popen] = []
+
+
+def _worker_port(worker:int) -> int:
+    return worker_base_port + worker
+
+
+def _http_get(url:str, headers:Dict[str, str], timeout:float=5.0) -> Tuple[int, Dict[str, str], bytes]:
+    try:
+        with urlopen(UrlRequest(url, headers=headers), timeout=timeout) as resp:
+            return resp.status, dict(resp.headers), resp.read()
+    except HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+async def _worker_get(worker:int, path:str, headers:Union[Dict[str, str], None]=None) -> Tuple[int, Dict[str, str], bytes]:
+    url = "http://{}:{}{}".format(worker_host, _worker_port(worker), path)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _http_get, url, headers or {})
+
+
+def _start_workers():
+    for worker in range(num_workers):
+        cmd = [sys.executable, "-m", "uvicorn", "dnd_auction_game.server:app",
+               "--host", worker_host, "--port", str(_worker_port(worker)), "--log-level", "warning"]
+        print("starting worker {}: {}".format(worker, " ".join(cmd)))
+        _workers.append(subprocess.Popen(cmd, env=dict(os.environ)))
+
+
+async def _wait_for_workers(timeout:float=30.0):
+    deadline = time.monotonic() + timeout
+    for worker in range(num_workers):
+        while True:
+            try:
+                await _worker_get(worker, "/api/games")
+                break
+            except (URLError, OSError):
+                if time.monotonic() > deadline:
+                    print("worker {} did not start".format(worker))
+                    break
+                await asyncio.sleep(0.2)
+
+
+async def _sync_routes():
+    while True:
+        await asyncio.sleep(route_sync_interval)
+        for worker in range(num_workers):
+            try:
+                status, _, body = await _worker_get(worker, "/api/games")
+                if status != 200:
+                    continue
+                live = [game["game_id"] for game in json.loads(body).get("games", [])]
+            except (URLError, OSError, ValueError) as e:
+                print("error reaching worker {}: {}".format(worker, e))
+                continue
+
+            released = router.sync(worker, live, grace=route_sync_interval)
+            if released:
+                print("<worker {} dropped {} games>".format(worker, len(released)))
+
+
+def _stop_workers():
+    for p in _workers:
+        if p.poll() is None:
+            p.terminate()
+    for p in _workers:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+    _workers.clear()
+
+
+@asynccontextmanager
+async def start_workers(app: FastAPI):
+    _start_workers()
+    await _wait_for_workers()
+    print("<{} workers ready>".format(num_workers))
+    sync_task = asyncio.create_task(_sync_routes())
+    yield
+    sync_task.cancel()
+    _stop_workers()
+
+
+app = FastAPI(lifespan=start_workers)
+
+
+async def _relay_websocket(websocket: WebSocket, game_id: str, path: str, token: Union[str, None] = None):
+    # with a valid token the game may be new (the worker creates it), otherwise it has to exist already
+    if not _game_id_pattern.match(game_id):
+        return
+
+    if token is not None and token in (game_token, play_token):
+        worker = router.assign(game_id)
+    else:
+        worker = router.get(game_id)
+        if worker is None:
+            return
+    url = "ws://{}:{}{}".format(worker_host, _worker_port(worker), path)
+
+    await websocket.accept()
+    try:
+        async with websockets.connect(url, max_size=None) as upstream:
+
+            async def client_to_worker():
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    if message.get("text") is not None:
+                        await upstream.send(message["text"])
+                    elif message.get("bytes") is not None:
+                        await upstream.send(message["bytes"])
+
+            async def worker_to_client():
+                async for message in upstream:
+                    if isinstance(message, str):
+                        await websocket.send_text(message)
+                    else:
+                        await websocket.send_bytes(message)
+
+            tasks = [asyncio.create_task(client_to_worker()), asyncio.create_task(worker_to_client())]
+            # whichever side closes first ends the relay
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    except Exception as e:
+        print("error relaying {}: {}".format(path, e))
+
+    try:
+        await websocket.close()
+    except:
+        pass
+
+
+async def _relay_get(request: Request, game_id: str, path: str):
+    worker = router.get(game_id)
+    if worker is None:
+        return Response(content=json.dumps({"ok": False, "error": "unknown game"}), status_code=404, media_type="application/json")
+
+    headers = {}
+    if request.headers.get("if-none-match"):
+        headers["If-None-Match"] = request.headers["if-none-match"]
+
+    status, resp_headers, body = await _worker_get(worker, path, headers)
+
+    out_headers = {k: v for k, v in resp_headers.items() if k.lower() in ("etag", "cache-control")}
+    return Response(content=body, status_code=status, headers=out_headers,
+                    media_type=resp_headers.get("content-type", resp_headers.get("Content-Type")))
+
+
+@app.websocket("/ws/{token}")
+async def websocket_endpoint_client(websocket: WebSocket, token: str):
+    await _relay_websocket(websocket, DEFAULT_GAME_ID, "/ws/{}".format(token), token)
+
+
+@app.websocket("/ws/{game_id}/{token}")
+async def websocket_endpoint_game_client(websocket: WebSocket, game_id: str, token: str):
+    await _relay_websocket(websocket, game_id, "/ws/{}/{}".format(game_id, token), token)
+
+
+@app.websocket("/ws_run/{play_token}")
+async def websocket_endpoint_runner(websocket: WebSocket, play_token: str):
+    await _relay_websocket(websocket, DEFAULT_GAME_ID, "/ws_run/{}".format(play_token), play_token)
+
+
+@app.websocket("/ws_run/{game_id}/{play_token}")
+async def websocket_endpoint_game_runner(websocket: WebSocket, game_id: str, play_token: str):
+    await _relay_websocket(websocket, game_id, "/ws_run/{}/{}".format(game_id, play_token), play_token)
+
+
+@app.websocket("/ws_leadboard")
+async def websocket_endpoint_leadboard(websocket: WebSocket):
+    await _relay_websocket(websocket, DEFAULT_GAME_ID, "/ws_leadboard")
+
+
+@app.websocket("/ws_leadboard/{game_id}")
+async def websocket_endpoint_game_leadboard(websocket: WebSocket, game_id: str):
+    await _relay_websocket(websocket, game_id, "/ws_leadboard/{}".format(game_id))
+
+
+@app.get("/reset/{play_token}")
+async def reset_server(request: Request, play_token: str):
+    return await _relay_get(request, DEFAULT_GAME_ID, "/reset/{}".format(play_token))
+
+
+@app.get("/reset/{game_id}/{play_token}")
+async def reset_game(request: Request, game_id: str, play_token: str):
+    return await _relay_get(request, game_id, "/reset/{}/{}".format(game_id, play_token))
+
+
+@app.get("/")
+async def get(request: Request):
+    return await _relay_get(request, DEFAULT_GAME_ID, "/")
+
+
+@app.get("/game/{game_id}")
+async def get_game(request: Request, game_id: str):
+    return await _relay_get(request, game_id, "/game/{}".format(game_id))
+
+
+@app.get("/api/leadboard")
+async def get_leadboard_data(request: Request):
+    return await _relay_get(request, DEFAULT_GAME_ID, "/api/leadboard")
+
+
+@app.get("/api/games")
+async def get_games():
+    # every worker has its own (unused) default game, only report the one we route to
+    default_worker = router.get(DEFAULT_GAME_ID)
+    games = []
+    for worker in range(num_workers):
+        try:
+            status, _, body = await _worker_get(worker, "/api/games")
+        except (URLError, OSError) as e:
+            print("error reaching worker {}: {}".format(worker, e))
+            continue
+
+        for game in json.loads(body).get("games", []):
+            if game["game_id"] == DEFAULT_GAME_ID and worker != default_worker:
+                continue
+            game["worker"] = worker
+            games.append(game)
+
+    return {"games": games}
+
+
+def _add_worker_label(sample:str, worker:int) -> str:
+    if "{" in sample:
+        name, rest = sample.split("}", 1)
+        return "{},worker=\"{}\"}}{}".format(name, worker, rest)
+
+    name, rest = sample.split(" ", 1)
+    return "{}{{worker=\"{}\"}} {}".format(name, worker, rest)
+
+
+def _merge_metrics(texts:List[Tuple[int, str]]) -> str:
+    # every worker renders the same metric families: keep one HELP/TYPE header per family,
+    # group the samples of all workers under it and label them with their worker
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, List[str]] = {}
+    for worker, text in texts:
+        family = ""
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split(" ", 3)[2]
+                header = headers.setdefault(family, [])
+                if line not in header:
+                    header.append(line)
+                samples.setdefault(family, [])
+            elif line and not line.startswith("#"):
+                samples.setdefault(family, []).append(_add_worker_label(line, worker))
+
+    lines = []
+    for family, family_samples in samples.items():
+        lines.extend(headers.get(family, []))
+        lines.extend(family_samples)
+    return "\n".join(lines) + "\n"
+
+
+@app.get("/metrics")
+async def get_metrics():
+    texts = []
+    for worker in range(num_workers):
+        try:
+            status, _, body = await _worker_get(worker, "/metrics")
+        except (URLError, OSError) as e:
+            print("error reaching worker {}: {}".format(worker, e))
+            continue
+        texts.append((worker, body.decode("utf-8")))
+
+    return Response(content=_merge_metrics(texts), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/{game_id}/metrics")
+async def get_game_metrics(request: Request, game_id: str):
+    return await _relay_get(request, game_id, "/api/{}/metrics".format(game_id))
+
+
+@app.get("/api/late_bids")
+async def get_late_bids(request: Request):
+    return await _relay_get(request, DEFAULT_GAME_ID, "/api/late_bids")
+
+
+@app.get("/api/{game_id}/late_bids")
+async def get_game_late_bids(request: Request, game_id: str):
+    return await _relay_get(request, game_id, "/api/{}/late_bids".format(game_id))
+
+
+@app.get("/api/{game_id}/leadboard")
+async def get_game_leadboard_data(request: Request, game_id: str):
+    return await _relay_get(request, game_id, "/api/{}/leadboard".format(game_id))
@@ -0,0 +1,125 @@
+from typing import Callable, List, Optional
+
+from dnd_auction_game.auction_house import AuctionHouse
+
+
+class AuctionGameSimulator:
+    """Plays a full game in-process, without the server or any websockets.
+
+    Each bid callback has the same signature as the ``make_bid`` functions used
+    with ``AuctionGameClient`` and is called once per round, exactly like the
+    server would call it over the network.
+
+    With a seed the schedules, auctions, rolls and tie-breaks are the same on
+    every run (the callbacks have to be deterministic too for identical games).
+    """
+
+    def __init__(self, bid_callbacks:List[Callable], n_rounds:int=10, names:Optional[List[str]]=None, verbose:bool=False,
+                 seed:Optional[int]=None):
+        if len(bid_callbacks) < 1:
+            raise ValueError("Need at least one bid callback to run a simulation")
+
+        if names is not None and len(names) != len(bid_callbacks):
+            raise ValueError("Got {} names for {} bid callbacks".format(len(names), len(bid_callbacks)))
+
+        self.bid_callbacks = bid_callbacks
+        self.n_rounds = max(1, int(n_rounds))
+        self.verbose = verbose
+        self.seed = seed
+
+        if names is None:
+            names = [getattr(cb, "__name__", "agent") for cb in bid_callbacks]
+        self.names = names
+        self.agent_ids = ["sim_agent_{}".format(i) for i in range(len(bid_callbacks))]
+
+        self.auction_house = None
+
+    def run(self) -> List[dict]:
+        auction_house = AuctionHouse(game_token="", play_token="", save_logs=False, seed=self.seed)
+        self.auction_house = auction_house
+
+        for a_id, name in zip(self.agent_ids, self.names):
+            auction_house.add_agent(name, a_id, a_id)
+
+        auction_house.set_num_rounds(self.n_rounds)
+        auction_house.assign_priorities()
+        auction_house.is_active = True
+
+        callbacks = dict(zip(self.agent_ids, self.bid_callbacks))
+
+        while auction_house.round_counter < auction_house.num_rounds_in_game:
+            auction_house.process_pool_buys()
+            auction_house.process_all_bids()
+            round_data = auction_house.prepare_auctions_and_pool()
+            is_last_round = auction_house.round_counter >= auction_house.num_rounds_in_game
+
+            # the server sends a serialized copy, so agents never see bids placed
+            # by the other agents in the same round - take a snapshot to match that.
+            states = {a_id: dict(info) for a_id, info in round_data["states"].items()}
+
+            bank_state = {
+                "gold_income_per_round": round_data["remainder_gold_income"],
+                "bank_interest_per_round": round_data["remainder_bank_interest"],
+                "bank_limit_per_round": round_data["remainder_bank_limit"],
+            }
+
+            for a_id, bid_callback in callbacks.items():
+                try:
+                    new_bids = bid_callback(a_id,
+                                            round_data["round"],
+                                            states,
+                                            round_data["auctions"],
+                                            round_data["prev_auctions"],
+                                            round_data["pool"],
+                                            round_data["prev_pool_buys"],
+                                            bank_state)
+                except Exception as e:
+                    if self.verbose:
+                        print("error in bid callback for {}: {}".format(a_id, e))
+                    continue
+
+                # mirror the server: the answers to the final round are never processed
+                if is_last_round or not isinstance(new_bids, dict):
+                    continue
+
+                try:
+                    pool = new_bids.get("pool", 0)
+                    bids = new_bids.get("bids", {})
+                    if pool > 0:
+                        auction_house.register_pool_buy(a_id, pool)
+
+                    if isinstance(bids, dict):
+                        auction_house.register_bids(a_id, bids)
+
+                except Exception as e:
+                    if self.verbose:
+                        print("error processing bids for {}: {}".format(a_id, e))
+
+        auction_house.is_active = False
+        auction_house.is_done = True
+
+        return self.standings()
+
+    def standings(self) -> List[dict]:
+        if self.auction_house is None:
+            return []
+
+        standings = []
+        for a_id, info in self.auction_house.agents.items():
+            standings.append(
+                {
+                    "id": a_id,
+                    "name": self.auction_house.names[a_id],
+                    "points": info["points"],
+                    "gold": info["gold"],
+                }
+            )
+
+        standings.sort(key=lambda x: x["points"], reverse=True)
+        return standings
+
+
+def simulate_game(bid_callbacks:List[Callable], n_rounds:int=10, names:Optional[List[str]]=None,
+                  seed:Optional[int]=None) -> List[dict]:
+    simulator = AuctionGameSimulator(bid_callbacks, n_rounds=n_rounds, names=names, seed=seed)
+    return simulator.run()
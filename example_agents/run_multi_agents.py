@@ -1,11 +1,9 @@
 import argparse
-import os
 import random
-import signal
-import subprocess
-import sys
 from pathlib import Path
-from typing import List
+from typing import List, Optional
+
+from dnd_auction_game.multi_agent import MultiAgentHost, load_bid_callback
 
 
 THIS_DIR = Path(__file__).resolve().parent
@@ -26,10 +24,7 @@ def discover_agent_scripts() -> List[Path]:
     return sorted(scripts)
 
 
-def launch_agents(num_agents: int, extra_args: List[str] | None = None) -> None:
-    if extra_args is None:
-        extra_args = []
-
+def launch_agents(num_agents: int, host: str = "localhost", port: int = 8000, workers: Optional[int] = None) -> None:
     agents = discover_agent_scripts()
     if not agents:
         print("No agent_*.py scripts found in", THIS_DIR)
@@ -39,60 +34,22 @@ def launch_agents(num_agents: int, extra_args: List[str] | None = None) -> None:
     for a in agents:
         print(" -", a.name)
 
-    chosen: List[Path] = []
-    for _ in range(num_agents):
-        chosen.append(random.choice(agents))
+    factories = {a: load_bid_callback(str(a)) for a in agents}
+    multi_host = MultiAgentHost(host, port=port, workers=workers)
 
-    print(f"\nStarting {num_agents} agents (one OS process per agent)...")
+    print(f"\nStarting {num_agents} agents (all in this process)...")
+    for idx in range(num_agents):
+        script = random.choice(agents)
+        multi_host.add_agent(f"{script.stem}_{idx}", factories[script]())
 
-    procs: List[subprocess.Popen] = []
     try:
-        for idx, script in enumerate(chosen, start=1):
-            cmd = [sys.executable, str(script), *extra_args]
-            print(f"[{idx}/{num_agents}] launching: {' '.join(cmd)}")
-            proc = subprocess.Popen(cmd, cwd=str(THIS_DIR))
-            procs.append(proc)
-
-        print("\nAll agents launched. Press Ctrl+C to stop them.")
-
-        # Wait for any child to exit; keep the controller alive until then.
-        # If you prefer to run for a fixed time, you can change this loop.
-        while procs:
-            # Remove finished processes from the list
-            alive = []
-            for p in procs:
-                ret = p.poll()
-                if ret is None:
-                    alive.append(p)
-            procs = alive
-            if not procs:
-                break
-            try:
-                # Small sleep to avoid busy waiting
-                signal.pause()
-            except AttributeError:
-                # Windows: fall back to a simple blocking wait on the first process
-                procs[0].wait(timeout=1)
+        multi_host.run()
     except KeyboardInterrupt:
-        print("\nCtrl+C received, terminating agents...")
-    finally:
-        # Terminate any remaining children
-        for p in procs:
-            if p.poll() is None:
-                try:
-                    p.terminate()
-                except Exception:
-                    pass
-        for p in procs:
-            if p.poll() is None:
-                try:
-                    p.kill()
-                except Exception:
-                    pass
+        print("\nCtrl+C received, stopping agents...")
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Run multiple DND auction agents in parallel.")
+    parser = argparse.ArgumentParser(description="Run multiple DND auction agents in one process.")
     parser.add_argument(
         "--num",
         "-n",
@@ -100,17 +57,19 @@ def main() -> None:
         default=4,
         help="Number of agents to start (default: 4)",
     )
+    parser.add_argument("--host", default="localhost", help="Game server host (default: localhost)")
+    parser.add_argument("--port", type=int, default=8000, help="Game server port (default: 8000)")
     parser.add_argument(
-        "extra",
-        nargs=argparse.REMAINDER,
-        help="Extra arguments to pass through to each agent script (optional)",
+        "--workers",
+        type=int,
+        default=None,
+        help="Threads running the bid callbacks (default: ThreadPoolExecutor default)",
     )
 
     args = parser.parse_args()
     num_agents = max(1, args.num)
-    extra_args = args.extra or []
 
-    launch_agents(num_agents, extra_args)
+    launch_agents(num_agents, args.host, args.port, args.workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+import random
+
+from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.simulate import AuctionGameSimulator
+
+
+def _schedules(auction_house:AuctionHouse) -> tuple:
+    return (auction_house.gold_income_per_round, auction_house.bank_limit_per_round, auction_house.bank_interest_per_round)
+
+
+def test_schedules_only_depend_on_seed_and_rounds():
+    # the /ws_run path: created unseeded, then seeded and sized by the runner
+    server = AuctionHouse(game_token="", play_token="")
+    server.set_seed(5)
+    server.set_num_rounds(40)
+
+    simulator = AuctionGameSimulator([lambda *args: {}], n_rounds=40, seed=5)
+    simulator.run()
+    assert _schedules(simulator.auction_house) == _schedules(server)
+
+    # sizing the game again gives the same schedules, not the next ones from the stream
+    server.set_num_rounds(40)
+    assert _schedules(simulator.auction_house) == _schedules(server)
+
+
+def test_unseeded_game_records_its_seed():
+    auction_house = AuctionHouse(game_token="", play_token="")
+    auction_house.set_num_rounds(30)
+    assert isinstance(auction_house.seed, int)
+
+    replay = AuctionHouse(game_token="", play_token="", seed=auction_house.seed)
+    replay.set_num_rounds(30)
+    assert _schedules(replay) == _schedules(auction_house)
+
+    # a reset of an unseeded game starts a new random game, a seeded one starts the same game again
+    auction_house.reset()
+    assert auction_house.seed != replay.seed
+    seed = replay.seed
+    replay.reset()
+    assert replay.seed == seed
+
+
+def _game(n_agents:int=3) -> AuctionHouse:
+    auction_house = AuctionHouse(game_token="", play_token="", seed=1)
+    for i in range(n_agents):
+        auction_house.add_agent("agent_{}".format(i), "agent_{}".format(i), "player")
+    auction_house.assign_priorities()
+    auction_house.prepare_auctions_and_pool()
+    return auction_house
+
+
+def test_register_bids_skips_invalid_bids_in_order():
+    auction_house = _game()
+    a1, a2, a3 = list(auction_house.current_auctions)[:3]
+    gold = auction_house.agents["agent_0"]["gold"]
+
+    bids = {a1: gold - 10, "unknown": 5, a2: "lots", a3: 0}
+    assert auction_house.register_bids("agent_0", bids) == 1
+    # only 10 gold is left for the rest
+    assert auction_house.register_bids("agent_0", {a2: 11, a3: 10}) == 1
+    assert auction_house.agents["agent_0"]["gold"] == 0
+    assert auction_house.current_bids[a1] == [("agent_0", gold - 10)]
+    assert not auction_house.current_bids.get(a2)
+    assert auction_house.current_bids[a3] == [("agent_0", 10)]
+
+    # unknown agents and messages that are not a dict are ignored
+    assert auction_house.register_bids("nobody", {a1: 1}) == 0
+    assert auction_house.register_bids("agent_1", [a1, 1]) == 0
+
+
+def test_register_bids_rejects_more_bids_than_auctions():
+    auction_house = _game()
+    gold = auction_house.agents["agent_0"]["gold"]
+    bids = {auction_id: 1 for auction_id in auction_house.current_auctions}
+    bids["a_made_up"] = 1
+
+    assert auction_house.register_bids("agent_0", bids) == 0
+    assert auction_house.agents["agent_0"]["gold"] == gold
+    assert all(not bids for bids in auction_house.current_bids.values())
+
+
+def test_register_bids_matches_register_bid():
+    batched, single = _game(), _game()
+    rng = random.Random(2)
+    auction_ids = list(batched.current_auctions)
+    for a_id in batched.agents:
+        bids = {rng.choice(auction_ids + ["unknown"]): rng.choice([rng.randint(-5, 800), "x", None]) for _ in range(4)}
+        batched.register_bids(a_id, bids)
+        for auction_id, gold in bids.items():
+            single.register_bid(a_id, auction_id, gold)
+
+    assert dict(batched.current_bids) == dict(single.current_bids)
+    assert batched.agents.to_dict() == single.agents.to_dict()
+
+
+def test_accept_round_drops_bids_for_other_rounds():
+    auction_house = _game()
+    auction_house.prepare_auctions_and_pool()
+    assert auction_house.current_round == 1
+
+    assert auction_house.accept_round("agent_0", 1)
+    assert auction_house.accept_round("agent_0", None) # older clients don't tag their bids
+    assert not auction_house.accept_round("agent_0", 0)
+    assert not auction_house.accept_round("agent_1", "1")
+
+    stats = auction_house.late_bid_stats()
+    assert stats["agent_0"]["messages"] == 3 and stats["agent_0"]["late"] == 1
+    assert stats["agent_1"]["messages"] == 1 and stats["agent_1"]["late"] == 1
@@ -0,0 +1,45 @@
+import copy
+import functools
+import json
+import random
+
+from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.client import _round_record
+from dnd_auction_game.log_writer import LogWriter
+from dnd_auction_game.protocol import COMPACT_STATES, SCHEDULE_DELTA, RoundStateDecoder, encode_round_state
+
+
+def _messages(n_rounds:int):
+    rng = random.Random(3)
+    auction_house = AuctionHouse(game_token="", play_token="", seed=3)
+    for i in range(4):
+        auction_house.add_agent("agent_{}".format(i), "agent_{}".format(i), "player")
+    auction_house.set_num_rounds(n_rounds)
+    auction_house.assign_priorities()
+    for _ in range(n_rounds):
+        auction_house.process_pool_buys()
+        auction_house.process_all_bids()
+        state = auction_house.prepare_auctions_and_pool()
+        yield json.dumps(encode_round_state(state, (SCHEDULE_DELTA, COMPACT_STATES)))
+        for a_id in auction_house.agents:
+            auction_house.register_bids(a_id, {auction_id: rng.randint(1, 50) for auction_id in auction_house.current_auctions})
+
+
+def test_buffered_record_is_the_round_the_callback_got(tmp_path):
+    decoder = RoundStateDecoder()
+    log_writer = LogWriter(flush_interval=0.01)
+    path = str(tmp_path / "agent.jsonl")
+    expected = []
+    for raw in _messages(5):
+        round_data = decoder.decode(json.loads(raw))
+        round_data["current_agent"] = "agent_0"
+        expected.append(copy.deepcopy(round_data))
+        log_writer.write(path, functools.partial(_round_record, raw, decoder.schedules, decoder.agent_ids, "agent_0"))
+
+        # whatever the bid callback does to its round state doesn't end up in the log
+        round_data["states"].clear()
+        round_data["remainder_gold_income"].append(-1)
+
+    log_writer.close()
+    with open(path) as fp:
+        assert [json.loads(line) for line in fp] == expected
@@ -0,0 +1,192 @@
+import random
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from dnd_auction_game.agent_table import AgentTable
+from dnd_auction_game.auction_house import AuctionHouse
+
+
+############################################################################################
+#
+# Regression checks of the array based round updates
+#   process_all_bids (its plain Python and NumPy paths) is compared against the dict based
+#   version it replaced, and the AgentTable points history against a plain per-agent list
+#   of points, on fixed seeds.
+#
+############################################################################################
+
+
+def reference_process_all_bids(gold:Dict[str, int], points:Dict[str, int], priority:Dict[str, int],
+                               current_bids:Dict[str, list], current_rolls:Dict[str, int], tie_rng:random.Random,
+                               n_agents:int, gold_back_fraction:float, convert_to_pool_fraction:float) -> int:
+    # the original one auction at a time version, returns the new gold in the pool
+    gold_from_non_winning_bids = 0
+    for auction_id, bids in current_bids.items():
+        if not bids:
+            continue
+        roll = current_rolls.get(auction_id)
+        if roll is None:
+            continue
+        win_amount = max(bids, key=lambda x:x[1])[1]
+        tied = [a_id for a_id, bid in bids if bid == win_amount]
+        if len(tied) == 1:
+            winner = tied[0]
+        else:
+            winner = max(tied, key=lambda a: priority.get(a, 0))
+            losers_tied = [a for a in tied if a != winner]
+            if losers_tied:
+                weights = [1.0 / max(priority.get(a, 1), 1) for a in losers_tied]
+                swap_with = tie_rng.choices(losers_tied, weights=weights, k=1)[0]
+                pw = priority.get(winner, 0)
+                pl = priority.get(swap_with, 0)
+                priority[winner] = pl
+                priority[swap_with] = pw
+
+        for a_id, bid in bids:
+            if a_id == winner and bid == win_amount:
+                points[a_id] += roll
+            else:
+                back_value = int(bid * gold_back_fraction)
+                removed_value = max(0, bid - back_value)
+                gold_from_non_winning_bids += removed_value
+                gold[a_id] += back_value
+
+    return max(n_agents, int(gold_from_non_winning_bids * convert_to_pool_fraction))
+
+
+def _random_round(auction_house:AuctionHouse, rng:random.Random, max_bid:int):
+    auction_ids = list(auction_house.current_auctions)
+    for a_id in auction_house.agents:
+        chosen = rng.sample(auction_ids, rng.randint(0, len(auction_ids)))
+        if rng.random() < 0.5:
+            auction_house.register_bids(a_id, {auction_id: rng.randint(1, max_bid) for auction_id in chosen})
+        else:
+            # single bids may repeat an auction, the same agent can then tie with itself
+            for auction_id in chosen + chosen[:1]:
+                auction_house.register_bid(a_id, auction_id, rng.randint(1, max_bid))
+
+
+@pytest.mark.parametrize("python", [True, False], ids=["python", "numpy"])
+@pytest.mark.parametrize("seed", range(20))
+def test_process_all_bids_matches_reference(seed, python):
+    rng = random.Random(seed)
+    auction_house = AuctionHouse(game_token="", play_token="", seed=seed)
+    auction_house.python_max_bids = 2**62 if python else -1
+    auction_house.set_num_rounds(30)
+    for i in range(rng.randint(2, 40)):
+        auction_house.add_agent("agent_{}".format(i), "agent_{}".format(i), "player")
+    auction_house.assign_priorities()
+    auction_house.prepare_auctions_and_pool()
+
+    for round_i in range(15):
+        if round_i == 5:
+            # agents that join after the priorities are assigned have priority 0
+            auction_house.add_agent("late_a", "late_a", "player")
+            auction_house.add_agent("late_b", "late_b", "player")
+
+        # low bids, so most auctions end in a tie
+        _random_round(auction_house, rng, max_bid=rng.choice([2, 3, 50]))
+
+        agents = auction_house.agents
+        gold = dict(zip(agents.ids, agents.gold.tolist()))
+        points = dict(zip(agents.ids, agents.points.tolist()))
+        priority = dict(zip(agents.ids, agents.priority.tolist()))
+        tie_rng = random.Random()
+        tie_rng.setstate(auction_house.tie_rng.getstate())
+        pool = reference_process_all_bids(gold, points, priority, auction_house.current_bids, auction_house.current_rolls,
+                                          tie_rng, len(agents), auction_house.gold_back_fraction,
+                                          auction_house.convert_to_pool_fraction)
+
+        auction_house.process_all_bids()
+        assert dict(zip(agents.ids, agents.gold.tolist())) == gold
+        assert dict(zip(agents.ids, agents.points.tolist())) == points
+        assert dict(zip(agents.ids, agents.priority.tolist())) == priority
+        assert auction_house.gold_in_pool == pool
+        assert auction_house.tie_rng.getstate() == tie_rng.getstate()
+
+        auction_house.prepare_auctions_and_pool()
+
+
+def test_process_all_bids_is_deterministic_for_a_seed():
+    def play(seed:int) -> List[dict]:
+        rng = random.Random(seed)
+        auction_house = AuctionHouse(game_token="", play_token="", seed=seed)
+        for i in range(10):
+            auction_house.add_agent("agent_{}".format(i), "agent_{}".format(i), "player")
+        auction_house.assign_priorities()
+        auction_house.prepare_auctions_and_pool()
+
+        states = []
+        for _ in range(8):
+            _random_round(auction_house, rng, max_bid=3)
+            auction_house.process_all_bids()
+            states.append(auction_house.prepare_auctions_and_pool()["states"])
+        return states
+
+    assert play(7) == play(7)
+
+
+def _auction_house(n_agents:int, seed:int, python:bool) -> AuctionHouse:
+    auction_house = AuctionHouse(game_token="", play_token="", seed=seed)
+    auction_house.python_max_auctions = 2**62 if python else -1
+    for i in range(n_agents):
+        auction_house.add_agent("agent_{}".format(i), "agent_{}".format(i), "player")
+    return auction_house
+
+
+@pytest.mark.parametrize("python", [True, False], ids=["python", "numpy"])
+def test_generated_auctions_are_valid(python):
+    auction_house = _auction_house(20, seed=11, python=python)
+    kinds = list(zip(auction_house.die_sizes, auction_house.max_n_die, auction_house.min_bonus, auction_house.max_bonus))
+
+    dies = set()
+    for _ in range(50):
+        auctions, rolls = auction_house._generate_auctions()
+        assert len(auctions) == 30 and auctions.keys() == rolls.keys()
+        for auction_id, auction in auctions.items():
+            die, num, bonus = auction["die"], auction["num"], auction["bonus"]
+            assert any(die == d and 1 <= num <= max_n and lo <= bonus <= hi for d, max_n, lo, hi in kinds)
+            assert num + bonus <= rolls[auction_id] <= num * die + bonus
+            dies.add(die)
+    assert dies == set(auction_house.die_sizes)
+
+    # the same seed gives the same auctions
+    first = _auction_house(20, seed=11, python=python)._generate_auctions()
+    assert _auction_house(20, seed=11, python=python)._generate_auctions() == first
+    assert _auction_house(20, seed=12, python=python)._generate_auctions() != first
+
+
+def _reference_history(table:AgentTable, history:Dict[str, List[int]]):
+    for a_id, p in zip(table.ids, table.points.tolist()):
+        history.setdefault(a_id, []).append(p)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_points_history_matches_reference(seed):
+    rng = random.Random(seed)
+    table = AgentTable(history_size=8, capacity=2)
+    history: Dict[str, List[int]] = {} # points after every round the agent was in
+
+    n_joined = 0
+    for _ in range(30):
+        for _ in range(rng.choice([0, 0, 1, 3])):
+            table.add("agent_{}".format(n_joined))
+            n_joined += 1
+        table.points[:] += np.array([rng.randint(-5, 20) for _ in range(len(table))], dtype=np.int64)
+        table.record_points()
+        _reference_history(table, history)
+
+        for window in (1, 3, 7):
+            gains = table.average_gains(window).tolist()
+            lines = table.sparklines(window)
+            for a_id, gain, line in zip(table.ids, gains, lines):
+                h = history[a_id]
+                base = h[-window - 1] if len(h) > window else 0
+                recent = h[-window:]
+                assert gain == pytest.approx((recent[-1] - base) / len(recent))
+                assert line == [p - base for p in recent]
+
+    with pytest.raises(ValueError):
+        table.average_gains(8)
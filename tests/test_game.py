@@ -0,0 +1,61 @@
+import asyncio
+
+from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.game import Game, GameRegistry
+from dnd_auction_game.metrics import METRICS, ROUNDS
+
+
+def _registry(**kwargs) -> GameRegistry:
+    return GameRegistry(lambda game_id: Game(game_id, AuctionHouse(game_token="", play_token="")), **kwargs)
+
+
+def test_idle_games_are_removed():
+    async def run():
+        registry = _registry(idle_timeout=10.0, pinned=["default"])
+        registry.start()
+        for game_id in ("default", "idle", "running", "watched"):
+            registry.get_or_create(game_id)
+        registry.get("running").auction_house.is_active = True
+        registry.get("watched").spectator_manager.active_connections.append(object())
+        ROUNDS.inc(game="idle")
+
+        idle = registry.get("idle")
+        assert registry.remove_idle(now=100.0) == []
+        assert registry.remove_idle(now=109.0) == []
+        assert registry.remove_idle(now=110.0) == ["idle"]
+        assert sorted(registry.games) == ["default", "running", "watched"]
+
+        await asyncio.sleep(0)
+        assert idle._task is None
+        assert METRICS.snapshot(game="idle")["auction_rounds_total"] == []
+
+        # idle time only counts while the game stays idle
+        registry.get("running").auction_house.is_active = False
+        assert registry.remove_idle(now=200.0) == []
+        registry.get("running").auction_house.is_active = True
+        registry.remove_idle(now=205.0)
+        registry.get("running").auction_house.is_active = False
+        assert registry.remove_idle(now=212.0) == []
+        assert registry.remove_idle(now=222.0) == ["running"]
+
+        await registry.stop()
+
+    asyncio.run(run())
+
+
+def test_waiting_games_are_limited():
+    registry = _registry(max_games=10, max_waiting=2, pinned=["default"])
+    registry.get_or_create("default")
+    assert registry.get_or_create("a", waiting=True) is not None
+    assert registry.get_or_create("b", waiting=True) is not None
+    assert registry.get_or_create("c", waiting=True) is None
+
+    # existing games can still be joined, and the runner can still create games
+    assert registry.get_or_create("a", waiting=True) is registry.get("a")
+    assert registry.get_or_create("c") is not None
+
+    # games count as waiting until they are started
+    assert registry.get_or_create("d", waiting=True) is None
+    registry.get("a").auction_house.is_active = True
+    registry.get("c").auction_house.is_active = True
+    assert registry.get_or_create("d", waiting=True) is not None
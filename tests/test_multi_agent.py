@@ -0,0 +1,64 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from dnd_auction_game.multi_agent import MultiAgentHost, _WorkerCallback, load_bid_callback
+
+
+COUNTER_AGENT = """
+class CounterAgent:
+    def __init__(self):
+        self.rounds = 0
+
+    def make_bid(self, agent_id, round, states, auctions, prev_auctions, pool, prev_pool_buys, bank_state):
+        self.rounds += 1
+        return {"bids": {}, "pool": self.rounds}
+"""
+
+BID_ARGS = ("agent", 0, {}, {}, {}, 0, {}, {})
+
+
+def stateless_bid(agent_id, round, states, auctions, prev_auctions, pool, prev_pool_buys, bank_state):
+    return {"bids": {}, "pool": 0}
+
+
+@pytest.fixture
+def counter_script(tmp_path) -> str:
+    path = tmp_path / "agent_counter.py"
+    path.write_text(COUNTER_AGENT)
+    return str(path)
+
+
+def test_worker_callbacks_keep_their_state(counter_script):
+    first = _WorkerCallback(counter_script, "agent_a")
+    second = _WorkerCallback(counter_script, "agent_b")
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        results = [pool.submit(cb, *BID_ARGS).result()["pool"] for cb in (first, first, second, first)]
+    assert results == [1, 2, 1, 3]
+
+
+def test_agents_by_spec_run_in_worker_processes(counter_script):
+    host = MultiAgentHost(processes=2)
+    client = host.add_agent("counter_1", counter_script)
+    assert isinstance(host.clients[0][1], _WorkerCallback)
+    assert host.clients[0][1].agent_id == client.agent_id
+
+    with pytest.raises(ValueError):
+        MultiAgentHost(processes=2, executor=ProcessPoolExecutor(max_workers=1))
+
+
+def test_shared_process_pool_rejects_stateful_callbacks(counter_script):
+    host = MultiAgentHost(executor=ProcessPoolExecutor(max_workers=1))
+    host.add_agent("stateless", stateless_bid)
+
+    for bid_callback in (load_bid_callback(counter_script + ":CounterAgent.make_bid")(), lambda *args: {}):
+        with pytest.raises(ValueError):
+            host.add_agent("stateful", bid_callback)
+
+    # plain functions from scripts loaded by path can't be imported by the pool's processes
+    script = counter_script.replace("agent_counter.py", "agent_plain.py")
+    with open(script, "w") as fp:
+        fp.write("def plain_bid(agent_id, round, states, auctions, prev_auctions, pool, prev_pool_buys, bank_state):\n"
+                 "    return {}\n")
+    with pytest.raises(ValueError):
+        host.add_agent("plain", load_bid_callback(script)())
@@ -0,0 +1,93 @@
+import copy
+import json
+import random
+from typing import List
+
+import pytest
+
+from dnd_auction_game.auction_house import AuctionHouse
+from dnd_auction_game.protocol import COMPACT_STATES, SCHEDULE_DELTA, RoundStateDecoder, encode_round_state, sync_message
+
+
+FEATURE_SETS = [(), (SCHEDULE_DELTA,), (COMPACT_STATES,), (SCHEDULE_DELTA, COMPACT_STATES)]
+
+
+def _round_states(n_rounds:int=6, n_agents:int=5, seed:int=0) -> List[dict]:
+    # the states a game sends, with bids and pool buys from every agent
+    rng = random.Random(seed)
+    auction_house = AuctionHouse(game_token="", play_token="", seed=seed)
+    for i in range(n_agents):
+        auction_house.add_agent("agent_{}".format(i), "agent_{}".format(i), "player")
+    auction_house.set_num_rounds(n_rounds)
+    auction_house.assign_priorities()
+
+    states = []
+    for _ in range(n_rounds):
+        auction_house.process_pool_buys()
+        auction_house.process_all_bids()
+        states.append(auction_house.prepare_auctions_and_pool())
+        for a_id in auction_house.agents:
+            auction_house.register_bids(a_id, {auction_id: rng.randint(1, 40) for auction_id in auction_house.current_auctions})
+            auction_house.register_pool_buy(a_id, rng.randint(0, 3))
+    return states
+
+
+def _wire(message:dict) -> dict:
+    return json.loads(json.dumps(message))
+
+
+def _sync(state:dict) -> dict:
+    # what the server sends an agent that connects while the game is running
+    schedules = {name: state[key] for key, name in (("remainder_gold_income", "gold_income_per_round"),
+                                                    ("remainder_bank_limit", "bank_limit_per_round"),
+                                                    ("remainder_bank_interest", "bank_interest_per_round"))}
+    return sync_message(schedules, list(state["states"].keys()))
+
+
+@pytest.mark.parametrize("features", FEATURE_SETS, ids=lambda f: "+".join(f) or "legacy")
+def test_round_trip(features):
+    states = _round_states()
+    decoder = RoundStateDecoder()
+    for state in states:
+        original = copy.deepcopy(state)
+        message = _wire(encode_round_state(state, features))
+        assert state == original # the same state is encoded for every feature set
+        assert decoder.decode(message) == _wire(state)
+
+
+@pytest.mark.parametrize("features", FEATURE_SETS, ids=lambda f: "+".join(f) or "legacy")
+def test_round_trip_after_reconnect(features):
+    states = _round_states()
+    decoder = RoundStateDecoder()
+    assert decoder.decode(_wire(_sync(states[0]))) is None
+
+    for state in states[2:]:
+        assert decoder.decode(_wire(encode_round_state(state, features))) == _wire(state)
+
+
+def test_schedules_are_only_sent_once():
+    states = _round_states()
+    messages = [encode_round_state(state, (SCHEDULE_DELTA,)) for state in states]
+    assert "schedules" in messages[0]
+    for message, state in zip(messages[1:], states[1:]):
+        assert "schedules" not in message and "remainder_gold_income" not in message
+        assert message["schedule_offset"] == state["round"]
+
+    with pytest.raises(ValueError):
+        RoundStateDecoder().decode(_wire(messages[1]))
+
+
+def test_compact_states_are_columns():
+    states = _round_states()
+    messages = [encode_round_state(state, (COMPACT_STATES,)) for state in states]
+    assert messages[0]["agent_ids"] == list(states[0]["states"].keys())
+
+    message, state = messages[3], states[3]
+    assert "agent_ids" not in message
+    assert message["states"]["gold"] == [info["gold"] for info in state["states"].values()]
+    assert len(message["prev_pool_buys"]) == len(state["prev_pool_buys"]) > 0
+    for auction in message["prev_auctions"].values():
+        assert all(isinstance(i, int) for i, _ in auction["bids"])
+
+    with pytest.raises(ValueError):
+        RoundStateDecoder().decode(_wire(message))
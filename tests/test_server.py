@@ -0,0 +1,35 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from dnd_auction_game import server
+from dnd_auction_game.simulate import AuctionGameSimulator
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("game_info", [{"seed": "abc"}, {"seed": -1}, {"num_rounds": [3]}, ["not", "a", "dict"]])
+def test_runner_rejects_bad_game_info(client, game_info):
+    with client.websocket_connect("/ws_run/seed_check/{}".format(server.play_token)) as ws:
+        ws.send_json(game_info)
+        reply = ws.receive_json()
+
+    assert reply["ok"] is False
+    assert server.registry.get("seed_check").auction_house.is_active is False
+
+
+def test_runner_seed_gives_the_simulator_game(client):
+    with client.websocket_connect("/ws_run/seed_game/{}".format(server.play_token)) as ws:
+        ws.send_json({"num_rounds": 40, "seed": 5})
+        reply = ws.receive_json()
+    assert reply["seed"] == 5
+
+    simulator = AuctionGameSimulator([lambda *args: {}], n_rounds=40, seed=5)
+    simulator.run()
+    auction_house = server.registry.get("seed_game").auction_house
+    assert auction_house.gold_income_per_round == simulator.auction_house.gold_income_per_round
+    assert auction_house.bank_interest_per_round == simulator.auction_house.bank_interest_per_round
@@ -0,0 +1,24 @@
+from dnd_auction_game.sharded_server import ShardRouter
+
+
+def test_router_balances_on_live_games():
+    router = ShardRouter(2, pinned=["default"])
+    router.assign("default")
+    for game_id in ("a", "b", "c"):
+        router.assign(game_id)
+    assert router.routes == {"default": 0, "a": 1, "b": 0, "c": 1}
+
+    # worker 1 removed "a", "c" was assigned too recently to tell
+    router._assigned_at["a"] -= 100.0
+    assert router.sync(1, [], grace=30.0) == ["a"]
+    assert router.get("a") is None
+    assert router.games_per_worker == [2, 1]
+
+    # the pinned default game is kept even if its worker doesn't list it
+    router._assigned_at["default"] -= 100.0
+    assert router.sync(0, ["b"], grace=30.0) == []
+
+    router._assigned_at["b"] -= 100.0
+    assert router.sync(0, [], grace=30.0) == ["b"]
+    assert router.assign("d") == 0
+    assert router.games_per_worker == [2, 1]